@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Minimum cosine similarity between two questions for a stored answer to be reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+# Seconds a stored answer stays valid
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Maximum number of stored answers (least recently used are evicted first)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+
+
+def context_signature(retrieved) -> str:
+    """Hash the ids and current metadata/text of the documents an answer was grounded on"""
+    digest = hashlib.sha256()
+    for item in retrieved.tasks + retrieved.reflections:
+        digest.update(json.dumps([item.id, item.document, item.metadata], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SemanticAnswerCache:
+    """Reuses LLM answers for near-identical questions asked against unchanged context
+
+    Entries are indexed per scope (chat), so a lookup only scans that chat's answers. A global
+    recency list enforces max_size across all chats.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_size=ANSWER_CACHE_SIZE):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._scopes = {}            # scope -> OrderedDict(entry id -> entry)
+        self._order = OrderedDict()  # entry id -> scope, least recently used first
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, scope, key):
+        entries = self._scopes[scope]
+        del entries[key]
+        del self._order[key]
+        if not entries:
+            del self._scopes[scope]
+
+    def _purge_expired(self, scope, now):
+        entries = self._scopes.get(scope, {})
+        expired = [key for key, entry in entries.items() if now - entry["created"] > self.ttl]
+        for key in expired:
+            self._remove(scope, key)
+
+    def lookup(self, scope, embedding, signature):
+        """Return a stored answer for a similar question with the same grounding context, or None"""
+        query = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            # Other chats' expired answers go when they next ask, or when they are the least recently used
+            self._purge_expired(scope, now)
+            candidates = [
+                (key, entry) for key, entry in self._scopes.get(scope, {}).items()
+                if entry["signature"] == signature
+            ]
+            if candidates:
+                scores = np.stack([entry["vector"] for _, entry in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    key, entry = candidates[best]
+                    self._scopes[scope].move_to_end(key)
+                    self._order.move_to_end(key)
+                    self.hits += 1
+                    return entry["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, scope, embedding, signature, answer):
+        with self._lock:
+            key = self._next_id
+            self._next_id += 1
+            self._scopes.setdefault(scope, OrderedDict())[key] = {
+                "vector": self._unit(embedding),
+                "signature": signature,
+                "answer": answer,
+                "created": time.time(),
+            }
+            self._order[key] = scope
+            while len(self._order) > self.max_size:
+                oldest, oldest_scope = next(iter(self._order.items()))
+                self._remove(oldest_scope, oldest)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._order),
+            "scopes": len(self._scopes),
+        }
+
+
+cache = SemanticAnswerCache()
@@ -0,0 +1,127 @@
+"""Hot/cold tiering: move finished history out of the collections searched on every message.
+
+Completed tasks older than ARCHIVE_TASKS_AFTER_DAYS and reflections older than
+ARCHIVE_REFLECTIONS_AFTER_DAYS move from a chat's collection to its archive collection
+(db_setup.archive_collection_name), embeddings and all, so nothing is embedded again.
+They stay in the task index, so exact questions ("what did I complete last March?") and
+mood aggregates still cover them, and task_manager.search_archive / /search_archive
+searches them on demand.
+
+Usage:
+    python archive.py    # compact every chat now (while the bot is stopped)
+"""
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+from db_setup import get_tenant_collection, get_archive_collection, tenant_collections, archive_collections
+import lexical_index
+import metrics
+import task_index
+import write_log
+
+logger = logging.getLogger(__name__)
+
+# Completed tasks are archived this many days after completion, reflections this many days after their date
+ARCHIVE_TASKS_AFTER_DAYS = int(os.getenv("ARCHIVE_TASKS_AFTER_DAYS", "30"))
+ARCHIVE_REFLECTIONS_AFTER_DAYS = int(os.getenv("ARCHIVE_REFLECTIONS_AFTER_DAYS", "90"))
+# Hours between background compactions while the bot runs (0 = only when run by hand)
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+# Items moved per Chroma round trip
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+archived = 0
+_stop = threading.Event()
+_thread = None
+
+
+def cutoffs(today=None):
+    """(completed_before, reflected_before) dates for task_index.archive_candidates"""
+    today = today or date.today()
+    return (
+        (today - timedelta(days=ARCHIVE_TASKS_AFTER_DAYS)).isoformat(),
+        (today - timedelta(days=ARCHIVE_REFLECTIONS_AFTER_DAYS)).isoformat(),
+    )
+
+
+def compact(owner=None, today=None, batch_size=ARCHIVE_BATCH_SIZE) -> int:
+    """Move one chat's archivable items to its archive collection; returns how many moved"""
+    global archived
+    completed_before, reflected_before = cutoffs(today)
+    hot = get_tenant_collection(owner)
+    moved = 0
+    while not _stop.is_set():
+        ids = task_index.archive_candidates(owner, completed_before, reflected_before, limit=batch_size)
+        if not ids:
+            break
+        # The flusher must not write to an item between reading it here and deleting it from the hot collection
+        with write_log.log.paused(), metrics.span("archive_batch"):
+            page = hot.get(ids=ids, include=["documents", "embeddings"])
+            if not page["ids"]:
+                break
+            # Metadata comes from the index, which already has completions still waiting in the write-behind log
+            metadatas = [task_index.get_metadata(item_id, owner) for item_id in page["ids"]]
+            # Archive first: a crash before the delete leaves a copy in both, which the next run finishes moving
+            get_archive_collection(owner).upsert(
+                ids=page["ids"],
+                documents=page["documents"],
+                embeddings=page["embeddings"],
+                metadatas=metadatas
+            )
+            hot.delete(ids=page["ids"])
+        task_index.mark_archived(page["ids"], owner)
+        lexical_index.remove_items(page["ids"], owner)
+        moved += len(page["ids"])
+    archived += moved
+    return moved
+
+
+def compact_all(today=None) -> dict:
+    """Compact every chat; returns {owner: items moved} for the chats that had anything to archive"""
+    start = time.perf_counter()
+    moved = {}
+    for owner, _ in tenant_collections():
+        if _stop.is_set():
+            break
+        count = compact(owner, today)
+        if count:
+            moved[owner] = count
+    if moved:
+        logger.info(f"Archived {sum(moved.values())} items from {len(moved)} chats in {time.perf_counter() - start:.2f}s")
+    return moved
+
+
+def _run(interval):
+    while not _stop.is_set():
+        try:
+            compact_all()
+        except Exception as e:
+            logger.warning(f"Archive compaction failed: {e}")
+        _stop.wait(interval)
+
+
+def start(interval_hours=ARCHIVE_INTERVAL_HOURS):
+    """Compact now and then every interval_hours in a background thread (needs a complete task index)"""
+    global _thread
+    if _thread is None and interval_hours > 0:
+        _stop.clear()
+        _thread = threading.Thread(target=_run, args=(interval_hours * 3600,), name="archive", daemon=True)
+        _thread.start()
+
+
+def stop():
+    """Stop the background compaction, letting the current batch finish"""
+    global _thread
+    if _thread is not None:
+        _stop.set()
+        _thread.join()
+        _thread = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    task_index.rebuild_from_chroma(tenant_collections(), archives=archive_collections())
+    moved = compact_all()
+    print(f"✅ Archived {sum(moved.values())} items from {len(moved)} chats")
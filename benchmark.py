@@ -0,0 +1,822 @@
+"""Offline end-to-end benchmarks for the bot.
+
+Usage:
+    python benchmark.py handlers [--sizes 1000 10000 100000] [--concurrency 1 8] [--requests 50]
+                                 [--llm-ttft 0.5] [--llm-tokens 64] [--llm-token-interval 0.02]
+                                 [--output results.json]
+    python benchmark.py retrieval [--sizes 1000 10000] [--queries 200] [--top-k 5]
+    python benchmark.py writes [--requests 2000] [--concurrency 1 16] [--batch-size 256] [--flush-interval 0.5]
+    python benchmark.py archive [--sizes 2000 20000] [--queries 100]
+    python benchmark.py transport [--requests 500] [--concurrency 1 32] [--text /start]
+    python benchmark.py ttft [--ollama-url http://localhost:11434] [--cold-runs 3] [--requests 20]
+
+The real handlers in telegram_bot are driven with synthetic Update/context objects against a
+temporary Chroma store and index, and a local stand-in for Ollama's /api/generate that
+replies with a configurable time-to-first-token, token count and inter-token delay
+(streamed or not). Results are printed as JSON (or written to --output) so runs can be
+compared over time.
+
+The retrieval benchmark runs query_tasks in "dense" (vector only) and "hybrid" (BM25 fused
+with vectors, keyword fast path) mode over id, exact-phrase, priority and topic queries
+whose relevant items are known, and reports recall@k and latency per query kind. Query
+embeddings are cached after first use as in the bot, so repeated phrasings measure search
+cost only.
+
+The writes benchmark sends /add_task and /add_reflection through the real handlers with
+write-behind off ("direct") and on, and reports acknowledgement latency plus the sustained
+rate at which writes actually reach Chroma.
+
+The archive benchmark grows two chats with the same years-long history (mostly completed
+tasks and dated reflections). One is never compacted and the other is compacted after
+each growth step. It reports the hot-path latency of search, message context retrieval
+and /plan_day context for both, plus on-demand archive search latency.
+
+The transport benchmark runs the real Application against a local stand-in for the Telegram
+Bot API and delivers the same updates by long polling and by webhook. It reports the time
+from handing an update to Telegram until the bot's first reply arrives, the throughput, and
+how many Bot API calls each mode made.
+
+The ttft benchmark needs a real Ollama. It measures time to first token of /plan_day and
+question prompts in three cases: with the model unloaded first (cold), warm with the
+shared instructions after the per-request content (inline, so no prefix is reused), and
+warm with the instructions as the shared system prompt (prefix).
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+
+# --- stand-in Ollama server ---------------------------------------------------------------
+
+class StubOllama:
+    """Minimal /api/generate server with tunable latency and a cap on concurrent generations"""
+
+    def __init__(self, ttft=0.5, tokens=64, token_interval=0.02, concurrency=1):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.slots = threading.Semaphore(concurrency)
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._send_json({"models": [{"name": "gemma3:1b"}]})
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub.requests += 1
+                with stub.slots:
+                    if payload.get("stream", True):
+                        self._stream()
+                    else:
+                        time.sleep(stub.ttft + stub.tokens * stub.token_interval)
+                        self._send_json(stub.final_chunk(" ".join(["word"] * stub.tokens)))
+
+            def _chunk(self, body):
+                data = (json.dumps(body) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(stub.ttft)
+                for _ in range(stub.tokens):
+                    self._chunk({"model": "gemma3:1b", "response": "word ", "done": False})
+                    time.sleep(stub.token_interval)
+                self._chunk(stub.final_chunk(""))
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def final_chunk(self, response):
+        return {
+            "model": "gemma3:1b",
+            "response": response,
+            "done": True,
+            "prompt_eval_count": 200,
+            "eval_count": self.tokens,
+            "eval_duration": int(self.tokens * self.token_interval * 1e9) or 1,
+        }
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# --- stand-in Telegram Bot API ------------------------------------------------------------
+
+class StubBotAPI:
+    """Just enough of the Bot API for an Application: getMe, long-polled getUpdates and replies
+
+    Tests queue updates with enqueue() (delivered by getUpdates) and wait for the bot's first
+    reply to a chat with expect().
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self._updates = []
+        self._ready = threading.Condition()
+        self._waiting = {}   # chat id -> (loop, future resolved with the reply's arrival time)
+        self._message_id = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; don't let Nagle delay the body
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or b"{}")
+                else:
+                    params = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+                method = self.path.rsplit("/", 1)[-1]
+                data = json.dumps({"ok": True, "result": stub.call(method, params)}).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except ConnectionError:
+                    pass  # a long poll the bot gave up on while stopping
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Halsey", "username": "halsey_bench_bot"}
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            with self._ready:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+                if not self._updates:
+                    self._ready.wait(float(params.get("timeout") or 0))
+                return self._updates[:int(params.get("limit") or 100)]
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id") or 0)
+            waiter = self._waiting.pop(chat_id, None)
+            if waiter is not None:
+                loop, future = waiter
+                loop.call_soon_threadsafe(future.set_result, time.perf_counter())
+            self._message_id += 1
+            return {"message_id": self._message_id, "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        return True  # deleteWebhook, setWebhook, ...
+
+    def enqueue(self, update):
+        with self._ready:
+            self._updates.append(update)
+            self._ready.notify_all()
+
+    def expect(self, chat_id):
+        """Future resolved with the perf_counter time of the bot's next message to chat_id"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting[chat_id] = (loop, future)
+        return future
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._ready:
+            self._ready.notify_all()
+        self.server.shutdown()
+
+
+def fake_update_json(update_id, chat_id, text):
+    """A private-chat message update as Telegram would deliver it"""
+    message = {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+# --- synthetic Telegram objects -----------------------------------------------------------
+
+class FakeMessage:
+    """Stands in for telegram.Message: records replies and edits instead of sending them"""
+
+    def __init__(self, text="", chat_id=1):
+        self.text = text
+        self.chat_id = chat_id
+        self.document = None
+        self.edits = 0
+
+    async def reply_text(self, text, **kwargs):
+        return FakeMessage(text, self.chat_id)
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        self.edits += 1
+        return self
+
+
+def fake_update(text, chat_id):
+    message = FakeMessage(text, chat_id)
+    return SimpleNamespace(message=message, effective_message=message, effective_chat=SimpleNamespace(id=chat_id))
+
+
+def fake_context(args=()):
+    return SimpleNamespace(args=list(args), bot_data={}, chat_data={}, user_data={})
+
+
+# --- workload -----------------------------------------------------------------------------
+
+PRIORITY_WORDS = ["ferrari", "tesla", "amazon", "suzuki", "orange", "budweiser", "greyhound"]
+TOPICS = ["quarterly report", "dentist appointment", "car insurance", "team slides", "electricity bill",
+          "flight to Lisbon", "garage cleanup", "sprint planning", "landlord leak", "weekly groceries"]
+QUESTIONS = ["What should I focus on this afternoon?", "How am I feeling this week?",
+             "Which tasks about the {topic} are still open?", "Anything urgent about the {topic}?",
+             "Summarize my {priority} tasks"]
+
+
+def seed_rows(start, count):
+    for i in range(start, start + count):
+        if i % 10 == 9:
+            yield {"type": "reflection", "text": f"Day {i}: felt okay about the {TOPICS[i % len(TOPICS)]} {i % 11}/10"}
+        else:
+            yield {"type": "task", "text": f"Work on the {TOPICS[i % len(TOPICS)]} item {i} {PRIORITY_WORDS[i % len(PRIORITY_WORDS)]}"}
+
+
+def history_rows(start, count, today=None):
+    """Items spread over the last two years: nine in ten tasks finished, reflections one per item day"""
+    today = today or datetime.date.today()
+    for i in range(start, start + count):
+        day = today - datetime.timedelta(days=i % 730)
+        created = f"{day.isoformat()} 09:00:00"
+        topic = TOPICS[i % len(TOPICS)]
+        if i % 10 == 9:
+            yield {"type": "reflection", "text": f"Day {i}: felt okay about the {topic} {i % 11}/10",
+                   "created_at": created, "date": day.isoformat()}
+        else:
+            done = i % 10 != 0
+            yield {"type": "task", "text": f"Work on the {topic} item {i} {PRIORITY_WORDS[i % len(PRIORITY_WORDS)]}",
+                   "created_at": created, "completed": done, "completed_at": f"{day.isoformat()} 17:00:00" if done else None}
+
+
+def seed_store(workdir, owner, start, count, rows=seed_rows):
+    """Grow the owner's store by count items through the bulk loader"""
+    import bulk_io
+
+    path = os.path.join(workdir, f"seed_{owner}_{start}.jsonl")
+    with open(path, "w") as f:
+        for row in rows(start, count):
+            f.write(json.dumps(row) + "\n")
+    stats = bulk_io.import_file(path, owner=owner)
+    os.remove(path)
+    return stats
+
+
+def handler_calls(telegram_bot, task_index, owner):
+    """Build one zero-argument coroutine factory per request for every benchmarked handler"""
+    open_ids = task_index.open_tasks(owner)["ids"]
+    random.shuffle(open_ids)
+
+    def add_task(i):
+        return telegram_bot.add_task_command(
+            fake_update("", owner), fake_context(f"Benchmark task {i} {PRIORITY_WORDS[i % 7]}".split()))
+
+    def complete_task(i):
+        task_id = open_ids[i % len(open_ids)] if open_ids else "task_missing"
+        return telegram_bot.complete_task_command(fake_update("", owner), fake_context([task_id]))
+
+    def plan_day(i):
+        # "refresh" bypasses the plan cache so every request measures a full build and generation
+        return telegram_bot.plan_day_command(fake_update("/plan_day refresh", owner), fake_context(["refresh"]))
+
+    def handle_message(i):
+        question = QUESTIONS[i % len(QUESTIONS)].format(topic=TOPICS[i % len(TOPICS)], priority=PRIORITY_WORDS[i % 7])
+        return telegram_bot.handle_message(fake_update(question, owner), fake_context())
+
+    return {
+        "add_task_command": add_task,
+        "complete_task_command": complete_task,
+        "plan_day_command": plan_day,
+        "handle_message": handle_message,
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def measure(factory, requests, concurrency):
+    """Run requests calls with at most concurrency in flight; returns (latencies, wall seconds, errors)"""
+    latencies = []
+    errors = 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        async with gate:
+            start = time.perf_counter()
+            try:
+                await factory(i)
+            except Exception as e:
+                errors += 1
+                print(f"request {i} failed: {e!r}", file=sys.stderr)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return sorted(latencies), time.perf_counter() - start, errors
+
+
+def summarize(latencies, wall, errors):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+    }
+
+
+def retrieval_queries(task_index, owner, count, seed=0):
+    """(kind, query, relevant ids) triples whose answers are known from the seeded texts"""
+    items = task_index.all_items(owner)
+    tasks = [(item_id, doc, meta) for item_id, doc, meta in zip(items["ids"], items["documents"], items["metadatas"])
+             if meta.get("type") == "task"]
+    by_topic, by_priority = {}, {}
+    for item_id, doc, meta in tasks:
+        for topic in TOPICS:
+            if topic in doc:
+                by_topic.setdefault(topic, set()).add(item_id)
+        if meta.get("priority_code"):
+            by_priority.setdefault(meta["priority_code"], set()).add(item_id)
+
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        item_id, doc, meta = rng.choice(tasks)
+        kind = ("id", "exact", "priority", "topic")[i % 4]
+        if kind == "id":
+            queries.append((kind, f"show task {item_id}", {item_id}))
+        elif kind == "exact":
+            # "Work on the dentist appointment item 123 tesla" -> "dentist appointment item 123"
+            queries.append((kind, doc[len("Work on the "):].rsplit(" ", 1)[0], {item_id}))
+        elif kind == "priority":
+            code = PRIORITY_WORDS[i % len(PRIORITY_WORDS)]
+            queries.append((kind, f"show my {code} tasks", by_priority.get(code, set())))
+        else:
+            topic = TOPICS[i % len(TOPICS)]
+            queries.append((kind, f"tasks about the {topic}", by_topic.get(topic, set())))
+    return queries
+
+
+def recall_at_k(found, relevant, k):
+    if not relevant:
+        return 1.0
+    return len(set(found[:k]) & relevant) / min(k, len(relevant))
+
+
+async def run_retrieval(args, workdir):
+    import task_index
+    import task_manager
+
+    owner = args.chat_id
+    results = []
+    stored = 0
+    for size in sorted(args.sizes):
+        if size > stored:
+            stats = seed_store(workdir, owner, stored, size - stored)
+            print(f"seeded {size - stored} items in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/s)", file=sys.stderr)
+            stored = size
+
+        queries = retrieval_queries(task_index, owner, args.queries)
+        for mode in ("dense", "hybrid"):
+            task_manager.RETRIEVAL_MODE = mode
+            by_kind = {}
+            for kind, query, relevant in queries:
+                start = time.perf_counter()
+                found = task_manager.query_tasks(query, top_k=args.top_k, owner=owner)["ids"][0]
+                elapsed = time.perf_counter() - start
+                latencies, recalls = by_kind.setdefault(kind, ([], []))
+                latencies.append(elapsed)
+                recalls.append(recall_at_k(found, relevant, args.top_k))
+
+            for kind, (latencies, recalls) in by_kind.items():
+                latencies.sort()
+                result = {
+                    "mode": mode, "kind": kind, "store_size": size,
+                    f"recall_at_{args.top_k}": sum(recalls) / len(recalls),
+                    "p50_ms": percentile(latencies, 0.50) * 1000,
+                    "p95_ms": percentile(latencies, 0.95) * 1000,
+                    "mean_ms": sum(latencies) / len(latencies) * 1000,
+                }
+                print(f"{mode:>6} {kind:>8} size={size:<7} recall@{args.top_k} {result[f'recall_at_{args.top_k}']:.2f}  "
+                      f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms", file=sys.stderr)
+                results.append(result)
+    return results
+
+
+async def run_writes(args, workdir):
+    import telegram_bot
+    import write_log
+
+    owner = args.chat_id
+    if args.batch_size:
+        write_log.log.batch_size = args.batch_size
+    if args.flush_interval is not None:
+        write_log.log.flush_interval = args.flush_interval
+
+    def write(i):
+        if i % 10 == 9:
+            return telegram_bot.add_reflection_command(fake_update("", owner), fake_context(f"Benchmark day {i} felt {i % 11}/10".split()))
+        return telegram_bot.add_task_command(
+            fake_update("", owner), fake_context(f"Benchmark write {i} about the {TOPICS[i % len(TOPICS)]} {PRIORITY_WORDS[i % 7]}".split()))
+
+    results = []
+    for mode in ("direct", "write-behind"):
+        write_log.WRITE_BEHIND = mode == "write-behind"
+        if write_log.WRITE_BEHIND:
+            write_log.log.start()
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            latencies, wall, errors = await measure(write, args.requests, concurrency)
+            # Sustained throughput counts until every acknowledged write is in Chroma
+            await asyncio.to_thread(write_log.log.drain)
+            stored = time.perf_counter() - start
+            result = {"mode": mode, "concurrency": concurrency, **summarize(latencies, wall, errors),
+                      "stored_per_sec": len(latencies) / stored if stored else 0.0}
+            print(f"{mode:>12} c={concurrency:<3} ack p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+                  f"{result['throughput_rps']:7.1f} acks/s  {result['stored_per_sec']:7.1f} stored/s", file=sys.stderr)
+            results.append(result)
+    write_log.log.stop()
+    return results
+
+
+async def run_archive(args, workdir):
+    import archive
+    import context_packer
+    import task_index
+    import task_manager
+    from db_setup import get_tenant_collection, get_archive_collection
+
+    single, tiered = args.chat_id, args.chat_id + 1
+    questions = [f"anything left about the {topic}" for topic in TOPICS]
+
+    def hot_paths(owner):
+        return {
+            "query_tasks": lambda i: task_manager.query_tasks(questions[i % len(questions)], owner=owner),
+            "retrieve_context": lambda i: task_manager.retrieve_context(questions[i % len(questions)], owner=owner),
+            "plan_context": lambda i: (task_index.open_tasks(owner), context_packer.reflection_summary(owner)),
+            "search_archive": lambda i: task_manager.search_archive(questions[i % len(questions)], owner=owner),
+        }
+
+    results = []
+    stored = 0
+    for size in sorted(args.sizes):
+        if size > stored:
+            for owner in (single, tiered):
+                stats = seed_store(workdir, owner, stored, size - stored, rows=history_rows)
+                print(f"seeded {size - stored} items in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/s)", file=sys.stderr)
+            start = time.perf_counter()
+            moved = archive.compact(tiered)
+            print(f"archived {moved} items in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            stored = size
+
+        for layout, owner in (("single", single), ("tiered", tiered)):
+            hot_items = get_tenant_collection(owner).count()
+            for name, call in hot_paths(owner).items():
+                if name == "search_archive" and layout == "single":
+                    continue
+                latencies = []
+                for i in range(args.queries):
+                    begin = time.perf_counter()
+                    call(i)
+                    latencies.append(time.perf_counter() - begin)
+                latencies.sort()
+                result = {
+                    "layout": layout, "path": name, "store_size": size, "hot_items": hot_items,
+                    "archived_items": get_archive_collection(owner).count(),
+                    "p50_ms": percentile(latencies, 0.50) * 1000,
+                    "p95_ms": percentile(latencies, 0.95) * 1000,
+                    "mean_ms": sum(latencies) / len(latencies) * 1000,
+                }
+                print(f"{layout:>6} {name:>16} size={size:<7} hot={hot_items:<7} "
+                      f"p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms", file=sys.stderr)
+                results.append(result)
+    return results
+
+
+async def run_transport(args, workdir):
+    import logging
+    import httpx
+    import telegram_bot
+    import webhook
+
+    for noisy in ("httpx", "telegram"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+    bot_api = StubBotAPI().start()
+    results = []
+    next_id = 1
+    try:
+        for mode in ("polling", "webhook"):
+            application = telegram_bot.build_application("1:benchmark", base_url=f"{bot_api.url}/bot")
+            await application.initialize()
+            server = None
+            # Telegram's side of the delivery runs off the bot's event loop in both modes, as it would for real
+            client = httpx.Client(limits=httpx.Limits(max_connections=webhook.WEBHOOK_MAX_CONNECTIONS))
+            if mode == "polling":
+                await application.updater.start_polling(poll_interval=0.0, timeout=10)
+            else:
+                server = webhook.WebhookServer(application, listen="127.0.0.1", port=0, secret="benchmark")
+                await server.start()
+            await application.start()
+
+            for concurrency in args.concurrency:
+                bot_api.calls.clear()
+                first_id = next_id
+                next_id += args.requests
+
+                async def deliver(i):
+                    update_id = first_id + i
+                    # A chat per update, so per-chat ordering never serialises the measurement
+                    chat_id = args.chat_id + update_id
+                    replied = bot_api.expect(chat_id)
+                    update = fake_update_json(update_id, chat_id, args.text)
+                    if server is None:
+                        bot_api.enqueue(update)
+                    else:
+                        response = await asyncio.to_thread(
+                            client.post, server.url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": "benchmark"})
+                        response.raise_for_status()
+                    await asyncio.wait_for(replied, timeout=60)
+
+                latencies, wall, errors = await measure(deliver, args.requests, concurrency)
+                result = {"mode": mode, "concurrency": concurrency, **summarize(latencies, wall, errors),
+                          "bot_api_calls": dict(bot_api.calls)}
+                print(f"{mode:>8} c={concurrency:<3} p50 {result['p50_ms']:7.2f} ms  p95 {result['p95_ms']:7.2f} ms  "
+                      f"{result['throughput_rps']:7.1f} updates/s  getUpdates calls {bot_api.calls.get('getUpdates', 0)}",
+                      file=sys.stderr)
+                results.append(result)
+
+            if server is not None:
+                await server.stop()
+            else:
+                await application.updater.stop()
+            await application.stop()
+            await application.shutdown()
+            client.close()
+    finally:
+        bot_api.stop()
+    return results
+
+
+def ttft_prompts(telegram_bot, count):
+    """count (/plan_day or question prompt) pairs, each with different tasks and wording"""
+    from task_manager import RetrievalResult, RetrievedItem, PRIORITIES
+
+    prompts = []
+    for i in range(count):
+        rows = list(seed_rows(i * 20, 20))
+        tasks = [row for row in rows if row["type"] == "task"]
+        metadatas = [{"type": "task", "priority_code": PRIORITY_WORDS[j % 7], "priority_description": PRIORITIES[PRIORITY_WORDS[j % 7]],
+                      "created_at": "2026-10-01 09:00:00"} for j in range(len(tasks))]
+        if i % 2:
+            retrieved = RetrievalResult(query_embedding=None, tasks=[
+                RetrievedItem(id=f"task_{j:08x}", document=row["text"], metadata=meta, distance=0.5)
+                for j, (row, meta) in enumerate(zip(tasks[:3], metadatas))
+            ])
+            question = QUESTIONS[i % len(QUESTIONS)].format(topic=TOPICS[i % len(TOPICS)], priority=PRIORITY_WORDS[i % 7])
+            prompts.append(telegram_bot.build_answer_prompt(question, retrieved))
+        else:
+            open_tasks = {"ids": [f"task_{j:08x}" for j in range(len(tasks))],
+                          "documents": [row["text"] for row in tasks], "metadatas": metadatas}
+            prompts.append(telegram_bot.build_plan_prompt(f"2026-10-{i % 28 + 1:02d}", open_tasks,
+                                                          f"Reflection history: {i} reflections, average mood 6.{i % 10}/10"))
+    return prompts
+
+
+async def run_ttft(args, workdir):
+    import httpx
+    import gemma_integration
+    import telegram_bot
+
+    async def first_token(prompt, system=None):
+        start = time.perf_counter()
+        async with contextlib.aclosing(gemma_integration.stream_text(prompt, system=system)) as fragments:
+            async for _ in fragments:
+                # Closing the stream here makes Ollama stop generating
+                return time.perf_counter() - start
+        return time.perf_counter() - start
+
+    async def unload():
+        async with httpx.AsyncClient(base_url=gemma_integration.OLLAMA_URL, timeout=60) as client:
+            response = await client.post("/api/generate", json={"model": gemma_integration.OLLAMA_MODEL, "keep_alive": 0})
+            response.raise_for_status()
+
+    prompts = ttft_prompts(telegram_bot, args.requests + args.cold_runs)
+    system = telegram_bot.SYSTEM_PROMPT
+    timings = {"cold": [], "warm inline": [], "warm prefix": []}
+
+    for i in range(args.cold_runs):
+        await unload()
+        timings["cold"].append(await first_token(prompts[i], system))
+
+    layouts = {
+        # The instructions after the request's own content, as prompts were built before
+        "warm inline": lambda prompt: (f"{prompt}\n\n{system}", None),
+        "warm prefix": lambda prompt: (prompt, system),
+    }
+    for name, layout in layouts.items():
+        await gemma_integration.preload(layout(prompts[0])[1])
+        for prompt in prompts[args.cold_runs:]:
+            timings[name].append(await first_token(*layout(prompt)))
+    await gemma_integration.close_async_client()
+
+    results = []
+    for name, values in timings.items():
+        values.sort()
+        if not values:
+            continue
+        result = {"case": name, "requests": len(values),
+                  "p50_ms": percentile(values, 0.50) * 1000, "p95_ms": percentile(values, 0.95) * 1000,
+                  "mean_ms": sum(values) / len(values) * 1000}
+        print(f"{name:>12} n={len(values):<4} first token p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms",
+              file=sys.stderr)
+        results.append(result)
+    return results
+
+
+def configure_environment(workdir, ollama_url=None):
+    """Point every storage path and the Ollama URL at the sandbox before the bot modules are imported"""
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma_store")
+    os.environ["TASK_INDEX_PATH"] = os.path.join(workdir, "task_index.sqlite3")
+    os.environ["EMBED_CACHE_DIR"] = os.path.join(workdir, "embedding_cache")
+    os.environ["WRITE_LOG_PATH"] = os.path.join(workdir, "write_log.jsonl")
+    if ollama_url:
+        os.environ["OLLAMA_URL"] = ollama_url
+    os.environ["STREAM_EDIT_INTERVAL"] = "0"
+
+
+async def run_handlers(args, workdir):
+    import logging
+    import telegram_bot
+    import task_index
+
+    # One INFO line per stub request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    owner = args.chat_id
+    handlers = args.handlers
+    results = []
+    stored = 0
+    for size in sorted(args.sizes):
+        if size > stored:
+            stats = seed_store(workdir, owner, stored, size - stored)
+            print(f"seeded {size - stored} items in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/s)", file=sys.stderr)
+            stored = size
+
+        for concurrency in args.concurrency:
+            calls = handler_calls(telegram_bot, task_index, owner)
+            for name in handlers:
+                latencies, wall, errors = await measure(calls[name], args.requests, concurrency)
+                result = {"handler": name, "store_size": size, "concurrency": concurrency, **summarize(latencies, wall, errors)}
+                print(f"{name:>22} size={size:<7} c={concurrency:<3} p50 {result['p50_ms']:8.1f} ms  "
+                      f"p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  {result['throughput_rps']:7.1f} req/s",
+                      file=sys.stderr)
+                results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    handlers = commands.add_parser("handlers", help="Latency/throughput of the real handlers")
+    handlers.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Store sizes (items) to test at")
+    handlers.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    handlers.add_argument("--requests", type=int, default=50, help="Requests per handler per configuration")
+    handlers.add_argument("--handlers", nargs="+", default=["add_task_command", "complete_task_command", "plan_day_command", "handle_message"])
+    handlers.add_argument("--chat-id", type=int, default=1000)
+
+    retrieval = commands.add_parser("retrieval", help="Recall and latency of dense vs hybrid task search")
+    retrieval.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Store sizes (items) to test at")
+    retrieval.add_argument("--queries", type=int, default=200, help="Queries per store size and mode")
+    retrieval.add_argument("--top-k", type=int, default=5)
+    retrieval.add_argument("--chat-id", type=int, default=1000)
+
+    writes = commands.add_parser("writes", help="Write latency and sustained throughput with and without write-behind")
+    writes.add_argument("--requests", type=int, default=2000, help="Writes per mode and concurrency")
+    writes.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    writes.add_argument("--batch-size", type=int, help="Write-behind flush batch size (default: WRITE_BATCH_SIZE)")
+    writes.add_argument("--flush-interval", type=float, help="Seconds between write-behind flushes (default: WRITE_FLUSH_INTERVAL)")
+    writes.add_argument("--chat-id", type=int, default=1000)
+
+    tiering = commands.add_parser("archive", help="Hot-path latency with and without archiving old history")
+    tiering.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000], help="History sizes (items) to test at")
+    tiering.add_argument("--queries", type=int, default=100, help="Calls per hot path, layout and size")
+    tiering.add_argument("--chat-id", type=int, default=1000, help="Chat id of the uncompacted chat (the next id is compacted)")
+
+    transport = commands.add_parser("transport", help="Update delivery latency/throughput of polling vs webhook")
+    transport.add_argument("--requests", type=int, default=500, help="Updates per mode and concurrency")
+    transport.add_argument("--concurrency", type=int, nargs="+", default=[1, 32])
+    transport.add_argument("--text", default="/start", help="Message text of every update (a command or a question answered without the LLM)")
+    transport.add_argument("--chat-id", type=int, default=1000, help="First chat id (each update gets its own chat)")
+
+    ttft = commands.add_parser("ttft", help="Time to first token: cold vs warm model, with and without prefix reuse (needs Ollama)")
+    ttft.add_argument("--ollama-url", default=os.getenv("OLLAMA_URL", "http://localhost:11434"))
+    ttft.add_argument("--cold-runs", type=int, default=3, help="Requests each made right after unloading the model")
+    ttft.add_argument("--requests", type=int, default=20, help="Warm requests per prompt layout")
+
+    for sub in (handlers,):
+        sub.add_argument("--llm-ttft", type=float, default=0.5, help="Stub Ollama time to first token (s)")
+        sub.add_argument("--llm-tokens", type=int, default=64, help="Stub Ollama tokens per response")
+        sub.add_argument("--llm-token-interval", type=float, default=0.02, help="Stub Ollama delay between tokens (s)")
+        sub.add_argument("--llm-concurrency", type=int, default=1, help="Generations the stub runs at once (1 = one CPU Ollama)")
+
+    for sub in (handlers, retrieval, writes, tiering, transport, ttft):
+        sub.add_argument("--output", help="Write the JSON results here instead of stdout")
+        sub.add_argument("--keep", action="store_true", help="Keep the temporary store for inspection")
+
+    args = parser.parse_args()
+
+    runners = {"handlers": run_handlers, "retrieval": run_retrieval, "writes": run_writes, "archive": run_archive,
+               "transport": run_transport, "ttft": run_ttft}
+    needs_llm = hasattr(args, "llm_ttft")
+    stub = StubOllama(args.llm_ttft, args.llm_tokens, args.llm_token_interval, args.llm_concurrency).start() if needs_llm else None
+    workdir = tempfile.mkdtemp(prefix="halsey_bench_")
+    configure_environment(workdir, stub.url if stub else getattr(args, "ollama_url", None))
+    try:
+        results = asyncio.run(runners[args.command](args, workdir))
+    finally:
+        if stub:
+            stub.stop()
+        if not args.keep:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "benchmark": args.command,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+        "stub_llm_requests": stub.requests if stub else 0,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
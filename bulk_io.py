@@ -0,0 +1,338 @@
+"""Streaming bulk import/export of tasks and reflections.
+
+Usage:
+    python bulk_io.py import tasks.jsonl [--owner CHAT_ID] [--batch-size 512] [--restart]
+    python bulk_io.py export backup.jsonl [--owner CHAT_ID]
+    python bulk_io.py claim-legacy --owner CHAT_ID
+    python bulk_io.py selftest    # row validation checks; no store is touched
+
+Files are JSONL or CSV (chosen by extension). Each row has a "type" ("task" or
+"reflection", default "task") and a "text"; optional columns are "id",
+"priority_code", "mood_score", "completed", "created_at", "completed_at", "date" and
+"owner" (the chat the row belongs to, used when no --owner is given).
+Export writes the same shape, so an export can be imported again as-is.
+
+claim-legacy moves everything stored before data was kept per chat (the shared
+"personal_assistant" collection and its archive) to one chat, stored embeddings
+included. Run it while the bot is stopped; the task index is rebuilt on the next start.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+from datetime import date, datetime
+
+from db_setup import get_tenant_collection, get_archive_collection, tenant_collections, archive_collections
+from embeddings import embed_texts
+from task_manager import task_metadata, reflection_metadata
+import task_index
+import lexical_index
+import plan_cache
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "512"))
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+
+# Stored metadata a row may carry over verbatim (e.g. from an export)
+PRESERVED_FIELDS = ("created_at", "completed_at", "date")
+EXPORT_FIELDS = ["owner", "id", "type", "text", "priority_code", "mood_score", "completed", "created_at", "completed_at", "date"]
+
+
+def _is_csv(path):
+    return path.lower().endswith(".csv")
+
+
+def read_rows(path):
+    """Yield one row per record without loading the whole file: a dict for CSV, the raw line for JSONL
+
+    JSONL lines are decoded by parse_row, so one malformed line only skips that row.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if _is_csv(path):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def parse_row(row):
+    """Decode a row from read_rows into a dict; raises ValueError for lines that are not a JSON object"""
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object, got {type(row).__name__}")
+    return row
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def _iso_field(row, key):
+    """A date/time column's value, checked to be an ISO string; None when empty"""
+    value = row.get(key)
+    if value in (None, ""):
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{key} must be an ISO date string, got {type(value).__name__}")
+    try:
+        (date if key == "date" else datetime).fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{key} is not an ISO date: {value!r}") from None
+    return value
+
+
+def prepare_row(row, source, row_number):
+    """Turn an input row into (id, document, metadata); raises ValueError for unusable rows"""
+    text = (row.get("text") or "").strip()
+    if not text:
+        raise ValueError("missing text")
+    item_type = (row.get("type") or "task").strip().lower()
+
+    # Values go into Chroma metadata and the task index as-is, so wrong types are rejected here
+    dates = {key: _iso_field(row, key) for key in PRESERVED_FIELDS}
+    if row.get("priority_code") and not isinstance(row["priority_code"], str):
+        raise ValueError("priority_code must be a string")
+
+    if item_type == "task":
+        metadata = task_metadata(text, row.get("priority_code") or None)
+        if row.get("completed") not in (None, ""):
+            metadata["completed"] = _as_bool(row["completed"])
+    elif item_type == "reflection":
+        mood = row.get("mood_score")
+        # Same 0-10 range /add_reflection enforces
+        metadata = reflection_metadata(text, min(max(int(mood), 0), 10) if mood not in (None, "") else None)
+    else:
+        raise ValueError(f"unknown type {item_type!r}")
+
+    for key, value in dates.items():
+        if value:
+            metadata[key] = value
+    if item_type == "reflection" and dates["created_at"] and not dates["date"]:
+        metadata["date"] = dates["created_at"][:10]
+
+    # Rows without an id get a deterministic one so a resumed import overwrites instead of duplicating
+    item_id = row.get("id") or f"{item_type}_" + hashlib.sha1(f"{source}:{row_number}:{text}".encode("utf-8")).hexdigest()[:8]
+    return item_id, text, metadata
+
+
+def _checkpoint_path(path):
+    return path + ".progress"
+
+
+def _read_checkpoint(path):
+    try:
+        with open(_checkpoint_path(path)) as f:
+            return json.load(f)["rows"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def _write_checkpoint(path, rows):
+    tmp = _checkpoint_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"rows": rows}, f)
+    os.replace(tmp, _checkpoint_path(path))
+
+
+def _row_owner(row, owner):
+    if owner is not None:
+        return owner
+    value = row.get("owner")
+    return int(value) if value not in (None, "") else None
+
+
+def import_file(path, owner=None, batch_size=IMPORT_BATCH_SIZE, resume=True, progress=None):
+    """Import a JSONL/CSV file in chunks, resuming after the last committed chunk
+
+    Rows go to the given owner's collection, or to the chat named in each row when owner is None.
+    Returns a dict with the number of imported and skipped rows and the rate.
+    """
+    source = os.path.basename(path)
+    done = _read_checkpoint(path) if resume else 0
+    imported = skipped = 0
+    start = time.perf_counter()
+
+    rows = itertools.islice(enumerate(read_rows(path)), done, None)
+    while True:
+        chunk = list(itertools.islice(rows, batch_size))
+        if not chunk:
+            break
+
+        by_owner = {}
+        for row_number, row in chunk:
+            try:
+                row = parse_row(row)
+                row_owner = _row_owner(row, owner)
+                item = prepare_row(row, source, row_number)
+            except (ValueError, TypeError, AttributeError) as e:
+                print(f"Skipping row {row_number + 1}: {e}")
+                skipped += 1
+                continue
+            by_owner.setdefault(row_owner, []).append(item)
+
+        for row_owner, items in by_owner.items():
+            ids, documents, metadatas = (list(column) for column in zip(*items))
+            embeddings = embed_texts(documents, cache_results=False)
+            get_tenant_collection(row_owner).upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+            task_index.upsert_items(ids, documents, metadatas, owner=row_owner)
+            lexical_index.add_items(ids, documents, metadatas, owner=row_owner)
+            plan_cache.invalidate(row_owner)
+            imported += len(ids)
+
+        done = chunk[-1][0] + 1
+        _write_checkpoint(path, done)
+        if progress:
+            elapsed = time.perf_counter() - start
+            progress(done, imported / elapsed if elapsed else 0.0)
+
+    if os.path.exists(_checkpoint_path(path)):
+        os.remove(_checkpoint_path(path))
+
+    elapsed = time.perf_counter() - start
+    return {
+        "imported": imported,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "rows_per_sec": imported / elapsed if elapsed else 0.0,
+    }
+
+
+def iter_items(tenants, page_size=EXPORT_PAGE_SIZE):
+    """Yield every item of the (owner, collection) pairs as an export row, one Chroma page at a time"""
+    for owner, collection in tenants:
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            for item_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                metadata = metadata or {}
+                row = {"owner": owner, "id": item_id, "type": metadata.get("type", "task"), "text": document}
+                row.update({key: metadata[key] for key in EXPORT_FIELDS if key in metadata and key not in row})
+                yield row
+            offset += page_size
+
+
+def export_file(path, owner=None, page_size=EXPORT_PAGE_SIZE):
+    """Stream one chat's items (or every chat's when owner is None) to a JSONL/CSV file
+
+    Returns the number of rows written.
+    """
+    # Archived items are exported too, so a backup holds the whole history
+    if owner is None:
+        tenants = itertools.chain(tenant_collections(), archive_collections())
+    else:
+        tenants = [(owner, get_tenant_collection(owner)), (owner, get_archive_collection(owner))]
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS) if _is_csv(path) else None
+        if writer:
+            writer.writeheader()
+        for row in iter_items(tenants, page_size):
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def claim_legacy(owner, page_size=EXPORT_PAGE_SIZE):
+    """Move the pre-tenant shared collection (and its archive) into a chat's collections; returns items moved"""
+    moved = 0
+    for source, target in ((get_tenant_collection(None), get_tenant_collection(owner)),
+                           (get_archive_collection(None), get_archive_collection(owner))):
+        while True:
+            page = source.get(include=["documents", "metadatas", "embeddings"], limit=page_size)
+            if not page["ids"]:
+                break
+            # Copy first, like archive compaction: a crash in between leaves items in both, and a rerun finishes the move
+            target.upsert(ids=page["ids"], documents=page["documents"], embeddings=page["embeddings"], metadatas=page["metadatas"])
+            source.delete(ids=page["ids"])
+            moved += len(page["ids"])
+    return moved
+
+
+# (row, whether prepare_row accepts it)
+_SELFTEST_ROWS = [
+    ({"text": "Buy milk tesla"}, True),
+    ({"type": "reflection", "text": "Good day", "mood_score": "8", "date": "2026-10-01"}, True),
+    ({"type": "reflection", "text": "ok", "created_at": "2026-10-01 09:30:00"}, True),
+    ({"type": "reflection", "text": "ok", "date": 20240101}, False),
+    ({"type": "reflection", "text": "ok", "date": "01/10/2026"}, False),
+    ({"text": "call mum", "created_at": ["2026-10-01"]}, False),
+    ({"text": "call mum", "completed_at": 1700000000}, False),
+    ({"text": "call mum", "priority_code": 3}, False),
+    ({"text": 5}, False),
+    ({"type": "note", "text": "x"}, False),
+    ({"type": "reflection", "text": "x", "mood_score": "great"}, False),
+]
+
+
+def selftest():
+    """Check prepare_row against sample rows; returns the number of failures"""
+    failures = 0
+    for row_number, (row, accepted) in enumerate(_SELFTEST_ROWS):
+        try:
+            prepare_row(row, "selftest", row_number)
+            ok = accepted
+        except (ValueError, TypeError, AttributeError):
+            ok = not accepted
+        if not ok:
+            failures += 1
+            print(f"❌ {row}: expected {'accepted' if accepted else 'skipped'}")
+    print(f"{'✅' if not failures else '❌'} {len(_SELFTEST_ROWS) - failures}/{len(_SELFTEST_ROWS)} row checks passed")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export tasks and reflections")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Import a JSONL or CSV file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--owner", type=int, help="Chat id to import into (default: the row's owner column)")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    import_parser.add_argument("--restart", action="store_true", help="Ignore any saved progress and start from the first row")
+
+    export_parser = commands.add_parser("export", help="Export everything to a JSONL or CSV file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--owner", type=int, help="Only export this chat (default: every chat)")
+
+    claim_parser = commands.add_parser("claim-legacy", help="Move data stored before per-chat collections to one chat")
+    claim_parser.add_argument("--owner", type=int, required=True, help="Chat id that gets the legacy data")
+
+    commands.add_parser("selftest", help="Run row validation checks")
+
+    args = parser.parse_args(argv)
+    if args.command == "selftest":
+        raise SystemExit(1 if selftest() else 0)
+    if args.command == "claim-legacy":
+        start = time.perf_counter()
+        count = claim_legacy(args.owner)
+        print(f"✅ Moved {count} legacy items to chat {args.owner} in {time.perf_counter() - start:.1f}s")
+    elif args.command == "import":
+        stats = import_file(
+            args.path,
+            owner=args.owner,
+            batch_size=args.batch_size,
+            resume=not args.restart,
+            progress=lambda rows, rate: print(f"{rows} rows read, {rate:.0f} rows/sec")
+        )
+        print(f"✅ Imported {stats['imported']} rows ({stats['skipped']} skipped) "
+              f"in {stats['seconds']:.1f}s - {stats['rows_per_sec']:.0f} rows/sec")
+    else:
+        start = time.perf_counter()
+        count = export_file(args.path, owner=args.owner)
+        elapsed = time.perf_counter() - start
+        print(f"✅ Exported {count} rows to {args.path} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
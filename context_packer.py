@@ -0,0 +1,108 @@
+import os
+from datetime import date, datetime
+
+import task_index
+from task_index import PRIORITY_ORDER
+
+# Approximate token budgets for the context part of each prompt (instructions are not counted)
+PLAN_TOKEN_BUDGET = int(os.getenv("PLAN_TOKEN_BUDGET", "1200"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "600"))
+# Days after which a task's recency bonus has halved
+RECENCY_HALF_LIFE_DAYS = float(os.getenv("RECENCY_HALF_LIFE_DAYS", "14"))
+
+# Ferrari outranks Tesla outranks ... ; tasks without a priority come last
+PRIORITY_WEIGHT = {code: 1.0 - i / len(PRIORITY_ORDER) for i, code in enumerate(PRIORITY_ORDER)}
+
+
+def estimate_tokens(text) -> int:
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+def _age_days(metadata, now):
+    try:
+        created = datetime.fromisoformat(metadata.get("created_at", ""))
+    except (TypeError, ValueError):
+        return RECENCY_HALF_LIFE_DAYS
+    return max((now - created.replace(tzinfo=None)).total_seconds() / 86400, 0.0)
+
+
+def score(metadata, distance=None, now=None):
+    """Rank an item by priority code, recency and (when it came from a search) similarity"""
+    now = now or datetime.now()
+    value = PRIORITY_WEIGHT.get(metadata.get("priority_code"), 0.0)
+    value += 0.5 ** (_age_days(metadata, now) / RECENCY_HALF_LIFE_DAYS)
+    if distance is not None:
+        value += 2.0 / (1.0 + distance)
+    return value
+
+
+def pack(lines, budget):
+    """Greedily keep the best (score, line, item) entries that fit in the token budget
+
+    Returns (kept, dropped) as lists of the entries' items, kept in the original order.
+    """
+    ranked = sorted(range(len(lines)), key=lambda i: lines[i][0], reverse=True)
+    used = 0
+    keep = set()
+    for i in ranked:
+        cost = estimate_tokens(lines[i][1])
+        if used + cost <= budget:
+            keep.add(i)
+            used += cost
+    kept = [lines[i][2] for i in range(len(lines)) if i in keep]
+    dropped = [lines[i][2] for i in range(len(lines)) if i not in keep]
+    return kept, dropped
+
+
+def collapse(tasks_metadata) -> str:
+    """Summarise tasks that did not fit as per-priority counts"""
+    counts = {}
+    for meta in tasks_metadata:
+        code = meta.get("priority_code") or "no priority"
+        counts[code] = counts.get(code, 0) + 1
+    order = [code for code in PRIORITY_ORDER if code in counts] + (["no priority"] if "no priority" in counts else [])
+    return ", ".join(f"{code.upper() if code != 'no priority' else code} {counts[code]}" for code in order)
+
+
+def rollup_line(rollup) -> str:
+    """One-line summary of all reflections, from task_index.reflection_rollup()"""
+    if not rollup:
+        return ""
+    line = f"{rollup['count']} reflections"
+    if rollup["first_date"]:
+        line += f" from {rollup['first_date']} to {rollup['last_date']}"
+    if rollup["mean_mood"] is not None:
+        line += f", average mood {rollup['mean_mood']:.1f}/10"
+    return line
+
+
+_PERIOD_LABELS = {"day": ("today", "yesterday"), "week": ("this week", "last week"), "month": ("this month", "last month")}
+
+
+def mood_line(trends) -> str:
+    """Compact mood summary from task_index.mood_trend() results keyed by period"""
+    parts = []
+    for period, trend in trends.items():
+        current = trend["current"]
+        if not current["count"]:
+            continue
+        label, previous = _PERIOD_LABELS[period]
+        part = f"{label} {current['mean']:.1f}/10 ({current['count']} entries, {current['min']:g}-{current['max']:g})"
+        if trend["change"] is not None:
+            part += f", {trend['change']:+.1f} vs {previous}"
+        parts.append(part)
+    return "; ".join(parts)
+
+
+def reflection_summary(owner=None, day=None) -> str:
+    """Reflection history and day/week/month mood lines for the plan prompt, read from the aggregates"""
+    day = day or date.today()
+    lines = []
+    history = rollup_line(task_index.reflection_rollup(owner))
+    if history:
+        lines.append(f"Reflection history: {history}")
+    mood = mood_line({period: task_index.mood_trend(owner, period, day) for period in task_index.MOOD_PERIODS})
+    if mood:
+        lines.append(f"Mood: {mood}")
+    return "\n".join(lines)
@@ -13,13 +13,179 @@ if __name__ == "__main__":
     collection = get_chroma_collection()
     print("Chroma collection created:", collection.name)'''
 
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
 from chromadb import PersistentClient
 
-def get_chroma_collection(collection_name="personal_assistant"):
-    client = PersistentClient(path="./chroma_store")
-    return client.get_or_create_collection(name=collection_name)
+logger = logging.getLogger(__name__)
+
+# Folder to store the vector database
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_store")
+
+# Per-chat data lives in its own collection: TENANT_PREFIX + chat id ("-" spelled "n")
+DEFAULT_COLLECTION = "personal_assistant"
+TENANT_PREFIX = "personal_assistant_chat_"
+# Completed tasks and old reflections are moved out of the searched collection into ARCHIVE_PREFIX + chat id
+ARCHIVE_COLLECTION = "personal_assistant_archive"
+ARCHIVE_PREFIX = "personal_assistant_archive_chat_"
+# Upper bound on cached collection handles (least recently used are dropped)
+CHROMA_MAX_CACHED_COLLECTIONS = int(os.getenv("CHROMA_MAX_CACHED_COLLECTIONS", "512"))
+
+# HNSW settings for new collections (unset = Chroma's defaults). Space, M and construction ef are
+# fixed once a collection exists. The search ef (higher = better recall, slower queries) is also
+# applied to existing collections when they are opened, which needs Chroma 1.0 or later.
+HNSW_SETTINGS = {
+    "hnsw:space": os.getenv("CHROMA_HNSW_SPACE"),  # l2, cosine or ip
+    "hnsw:M": os.getenv("CHROMA_HNSW_M"),
+    "hnsw:construction_ef": os.getenv("CHROMA_HNSW_CONSTRUCTION_EF"),
+    "hnsw:search_ef": os.getenv("CHROMA_HNSW_SEARCH_EF"),
+}
+
+def hnsw_metadata(**overrides):
+    """Collection metadata carrying the configured HNSW settings, or None to use Chroma's defaults
+
+    Overrides are given without the "hnsw:" prefix, e.g. hnsw_metadata(search_ef=200).
+    """
+    settings = dict(HNSW_SETTINGS)
+    settings.update((f"hnsw:{key}", value) for key, value in overrides.items())
+    metadata = {key: value if key == "hnsw:space" else int(value) for key, value in settings.items() if value is not None}
+    return metadata or None
+
+_client = None
+_collections = OrderedDict()
+_lock = threading.Lock()
+_warned_search_ef = False
+
+def get_chroma_client():
+    """Return the process-wide Chroma client, opening it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = PersistentClient(path=CHROMA_PATH)
+    return _client
+
+def get_chroma_collection(collection_name=DEFAULT_COLLECTION, metadata=None):
+    """Return a cached handle to the named collection (safe to call from worker threads)
+
+    A collection created by this call gets the HNSW settings in metadata (default: hnsw_metadata()).
+    """
+    with _lock:
+        collection = _collections.get(collection_name)
+        if collection is not None:
+            _collections.move_to_end(collection_name)
+            return collection
+    
+    collection = get_chroma_client().get_or_create_collection(name=collection_name, metadata=metadata or hnsw_metadata())
+    _apply_search_ef(collection)
+    with _lock:
+        _collections[collection_name] = collection
+        _collections.move_to_end(collection_name)
+        while len(_collections) > CHROMA_MAX_CACHED_COLLECTIONS:
+            _collections.popitem(last=False)
+    return collection
+
+def _apply_search_ef(collection):
+    """Bring the search ef of an existing collection in line with CHROMA_HNSW_SEARCH_EF
+
+    get_or_create_collection ignores HNSW settings for collections that already exist.
+    """
+    global _warned_search_ef
+    if HNSW_SETTINGS["hnsw:search_ef"] is None:
+        return
+    search_ef = int(HNSW_SETTINGS["hnsw:search_ef"])
+    configuration = getattr(collection, "configuration_json", None) or {}
+    if (configuration.get("hnsw") or {}).get("ef_search") == search_ef:
+        return
+    try:
+        collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    except TypeError:
+        # Chroma before 1.0 can't change index settings after creation
+        if not _warned_search_ef:
+            _warned_search_ef = True
+            logger.info("This Chroma version applies CHROMA_HNSW_SEARCH_EF only to collections created with it; "
+                        "export, remove chroma_store and import again to apply it to existing ones")
+
+def tenant_collection_name(owner=None):
+    """Collection holding one chat's data; owner None is the original shared collection"""
+    if owner is None:
+        return DEFAULT_COLLECTION
+    return f"{TENANT_PREFIX}{int(owner)}".replace("-", "n")
+
+def owner_from_collection_name(name):
+    """Inverse of tenant_collection_name; returns False for collections that aren't tenant data"""
+    if name == DEFAULT_COLLECTION:
+        return None
+    if name.startswith(TENANT_PREFIX):
+        return int(name[len(TENANT_PREFIX):].replace("n", "-"))
+    return False
+
+def get_tenant_collection(owner=None):
+    """Return the cached collection for a chat"""
+    return get_chroma_collection(tenant_collection_name(owner))
+
+def archive_collection_name(owner=None):
+    """Collection holding one chat's archived items"""
+    if owner is None:
+        return ARCHIVE_COLLECTION
+    return f"{ARCHIVE_PREFIX}{int(owner)}".replace("-", "n")
+
+def get_archive_collection(owner=None):
+    """Return the cached archive collection for a chat"""
+    return get_chroma_collection(archive_collection_name(owner))
+
+def _owners(name_to_owner):
+    for collection in get_chroma_client().list_collections():
+        # Newer Chroma versions list names, older ones Collection objects
+        name = getattr(collection, "name", collection)
+        owner = name_to_owner(name)
+        if owner is not False:
+            yield owner, get_chroma_collection(name)
+
+def tenant_collections():
+    """Yield (owner, collection) for every chat that has stored data"""
+    return _owners(owner_from_collection_name)
+
+def archive_collections():
+    """Yield (owner, collection) for every chat that has archived data"""
+    def owner_from_archive_name(name):
+        if name == ARCHIVE_COLLECTION:
+            return None
+        if name.startswith(ARCHIVE_PREFIX):
+            return int(name[len(ARCHIVE_PREFIX):].replace("n", "-"))
+        return False
+    return _owners(owner_from_archive_name)
+
+def close_chroma():
+    """Drop cached handles and release the client so its files are flushed and closed"""
+    global _client
+    with _lock:
+        _collections.clear()
+        if _client is not None:
+            # PersistentClient writes through to disk; clearing the system cache stops its components
+            _client.clear_system_cache()
+            _client = None
+
+def _benchmark(iterations=200):
+    """Compare opening a fresh client per call with the cached handle"""
+    def uncached():
+        return PersistentClient(path=CHROMA_PATH).get_or_create_collection(name="personal_assistant")
+
+    for label, opener in (("fresh client per call", uncached), ("cached handle", get_chroma_collection)):
+        opener()  # warm up
+        start = time.perf_counter()
+        for _ in range(iterations):
+            opener().count()
+        elapsed = time.perf_counter() - start
+        print(f"{label:>22}: {elapsed / iterations * 1000:.3f} ms/op over {iterations} ops")
 
 # Quick test to verify
 if __name__ == "__main__":
     collection = get_chroma_collection()
     print("Chroma collection created:", collection.name)
+    _benchmark()
+    close_chroma()
@@ -0,0 +1,130 @@
+"""Compare embedding backends: throughput, memory and retrieval parity.
+
+Usage:
+    python embedding_bench.py                      # every backend, torch as the reference
+    python embedding_bench.py --backends torch int8 --texts 2000 --top-k 5
+
+Each backend runs in its own subprocess so the reported RSS belongs to that backend alone.
+Parity is measured on a synthetic task corpus: for every query the backend's top-k
+tasks are compared with the reference backend's (overlap@k, and whether the top hit matches).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+VERBS = ["finish", "review", "email", "call", "schedule", "prepare", "pay", "book", "clean", "plan"]
+OBJECTS = ["the quarterly report", "the dentist", "mom about the weekend", "the car insurance",
+           "slides for the team meeting", "the electricity bill", "flights to Lisbon", "the garage",
+           "next sprint", "the landlord about the leak", "groceries for the week", "a gym session"]
+PRIORITY_WORDS = ["Ferrari", "Tesla", "Amazon", "Suzuki", "Orange", "Budweiser", "Greyhound"]
+QUERIES = ["urgent work deadline", "money and bills", "travel plans", "family", "health appointments",
+           "house chores", "meetings at work", "exercise", "shopping", "car stuff"]
+
+
+def corpus(size):
+    return [
+        f"{VERBS[i % len(VERBS)]} {OBJECTS[(i // len(VERBS)) % len(OBJECTS)]} {PRIORITY_WORDS[i % len(PRIORITY_WORDS)]}"
+        for i in range(size)
+    ]
+
+
+def rss_mb():
+    """Current resident set size of this process"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_backend(name, texts, top_k):
+    """Measure one backend in this process and return a JSON-serialisable report"""
+    import numpy as np
+    from embeddings import load_backend, EMBED_MAX_BATCH
+
+    baseline = rss_mb()
+    start = time.perf_counter()
+    encoder, device = load_backend(name)
+    load_seconds = time.perf_counter() - start
+
+    documents = corpus(texts)
+    encoder.encode(documents[:EMBED_MAX_BATCH], batch_size=EMBED_MAX_BATCH, show_progress_bar=False)  # warm up
+    start = time.perf_counter()
+    doc_vectors = encoder.encode(documents, batch_size=EMBED_MAX_BATCH, show_progress_bar=False)
+    elapsed = time.perf_counter() - start
+    query_vectors = encoder.encode(QUERIES, show_progress_bar=False)
+
+    doc_vectors = doc_vectors / np.linalg.norm(doc_vectors, axis=1, keepdims=True)
+    query_vectors = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    rankings = np.argsort(-(query_vectors @ doc_vectors.T), axis=1)[:, :top_k]
+
+    return {
+        "backend": name,
+        "device": device,
+        "load_seconds": load_seconds,
+        "texts_per_sec": len(documents) / elapsed,
+        "rss_mb": rss_mb(),
+        "rss_delta_mb": rss_mb() - baseline,
+        "rankings": rankings.tolist(),
+    }
+
+
+def parity(reference, candidate):
+    """Mean overlap@k of the top-k lists and the share of queries whose top hit matches"""
+    overlaps, top1 = [], []
+    for ref, cand in zip(reference["rankings"], candidate["rankings"]):
+        overlaps.append(len(set(ref) & set(cand)) / len(ref))
+        top1.append(ref[0] == cand[0])
+    return sum(overlaps) / len(overlaps), sum(top1) / len(top1)
+
+
+def main():
+    from embeddings import BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--texts", type=int, default=1000, help="Corpus size to encode")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-overlap", type=float, default=0.8, help="Fail if a backend's overlap@k drops below this")
+    parser.add_argument("--json", action="store_true", help="Print the reports as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.texts, args.top_k)))
+        return
+
+    reports = []
+    for name in args.backends:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", name, "--texts", str(args.texts), "--top-k", str(args.top_k)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        reports.append(json.loads(output.strip().splitlines()[-1]))
+
+    reference = reports[0]
+    failed = False
+    for report in reports:
+        report["overlap_at_k"], report["top1_agreement"] = parity(reference, report)
+        failed |= report["overlap_at_k"] < args.min_overlap
+
+    if args.json:
+        print(json.dumps([{k: v for k, v in r.items() if k != "rankings"} for r in reports], indent=2))
+    else:
+        print(f"reference: {reference['backend']}, corpus: {args.texts} texts, {len(QUERIES)} queries, k={args.top_k}")
+        for r in reports:
+            print(f"{r['backend']:>6} ({r['device']}): {r['texts_per_sec']:8.1f} texts/s  "
+                  f"RSS {r['rss_mb']:7.1f} MB (+{r['rss_delta_mb']:.1f} for the model)  "
+                  f"overlap@{args.top_k} {r['overlap_at_k']:.2f}  top-1 {r['top1_agreement']:.2f}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
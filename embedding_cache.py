@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# Where warm embeddings are kept between restarts (empty string keeps the cache in memory only)
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "./embedding_cache")
+# Number of embeddings held in the in-memory LRU tier
+EMBED_CACHE_MEMORY_SIZE = int(os.getenv("EMBED_CACHE_MEMORY_SIZE", "4096"))
+# Most embeddings kept on disk (~1.5 KB each at 384 dimensions); past it the least recently used
+# are dropped, leaving EMBED_CACHE_DISK_KEEP of the limit so compaction doesn't run on every write
+EMBED_CACHE_DISK_SIZE = int(os.getenv("EMBED_CACHE_DISK_SIZE", "100000"))
+EMBED_CACHE_DISK_KEEP = float(os.getenv("EMBED_CACHE_DISK_KEEP", "0.8"))
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC unicode with collapsed whitespace"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an in-memory LRU tier and a memory-mapped on-disk tier
+
+    On disk the cache is three files: meta.json (model name and dimension), vectors.f32 (a flat
+    float32 array, one row per embedding) and keys.txt (one key per line, row i holds key i).
+    The whole directory is discarded when the model name changes. Once it holds more than
+    disk_size embeddings it is rewritten with only the most recently used ones.
+    """
+
+    def __init__(self, model_name: str, directory: str = EMBED_CACHE_DIR, memory_size: int = EMBED_CACHE_MEMORY_SIZE,
+                 disk_size: int = EMBED_CACHE_DISK_SIZE):
+        self.model_name = model_name
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.compactions = 0
+        self._memory = OrderedDict()
+        self._rows = OrderedDict()  # key -> row in vectors.f32, least recently used first
+        self._dim = None
+        self._mmap = None
+        self._lock = threading.Lock()
+        if directory:
+            self._load()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self._path("meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+        if meta.get("model_name") != self.model_name or not os.path.exists(self._path("keys.txt")):
+            self._reset_disk()
+            return
+
+        self._dim = meta.get("dim")
+        if not self._dim:
+            return
+        row_bytes = self._dim * 4
+        vector_rows = os.path.getsize(self._path("vectors.f32")) // row_bytes if os.path.exists(self._path("vectors.f32")) else 0
+        with open(self._path("keys.txt"), encoding="utf-8") as f:
+            keys = [line.rstrip("\n") for line in f]
+
+        # Keys are written after their vector, so a crash can only leave extra vector rows behind
+        rows = min(vector_rows, len(keys))
+        # File order is the recency order of the last compaction, then insertion order
+        self._rows = OrderedDict((key, row) for row, key in enumerate(keys[:rows]))
+        if vector_rows != rows or len(keys) != rows:
+            with open(self._path("vectors.f32"), "a+b") as f:
+                f.truncate(rows * row_bytes)
+            with open(self._path("keys.txt"), "w", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key in keys[:rows])
+
+    def _reset_disk(self):
+        for name in ("vectors.f32", "keys.txt"):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        open(self._path("keys.txt"), "w").close()
+        self._write_meta()
+
+    def _write_meta(self):
+        with open(self._path("meta.json"), "w") as f:
+            json.dump({"model_name": self.model_name, "dim": self._dim}, f)
+
+    def _read_row(self, row):
+        if self._mmap is None or self._mmap.shape[0] <= row:
+            self._mmap = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r").reshape(-1, self._dim)
+        return self._mmap[row].tolist()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: list[str]) -> list:
+        """Return the cached embedding for each text, or None where it is missing"""
+        found = []
+        with self._lock:
+            for text in texts:
+                key = self.key(text)
+                vector = self._memory.get(key)
+                if key in self._rows:
+                    self._rows.move_to_end(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                elif key in self._rows:
+                    vector = self._read_row(self._rows[key])
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                found.append(vector)
+        return found
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        """Store freshly computed embeddings in both tiers"""
+        with self._lock:
+            new_keys, new_vectors = [], []
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                self._remember(key, vector)
+                if key in self._rows:
+                    self._rows.move_to_end(key)
+                elif self.directory:
+                    self._rows[key] = None
+                    new_keys.append(key)
+                    new_vectors.append(vector)
+
+            if not new_keys:
+                return
+            array = np.asarray(new_vectors, dtype=np.float32)
+            if self._dim is None:
+                self._dim = array.shape[1]
+                self._write_meta()
+            first_row = len(self._rows) - len(new_keys)
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.write(array.tobytes())
+            with open(self._path("keys.txt"), "a", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key in new_keys)
+            for offset, key in enumerate(new_keys):
+                self._rows[key] = first_row + offset
+            if len(self._rows) > self.disk_size:
+                self._compact(int(self.disk_size * EMBED_CACHE_DISK_KEEP))
+
+    def _compact(self, keep):
+        """Rewrite the disk tier with only the keep most recently used embeddings"""
+        kept = list(self._rows.items())[-keep:] if keep > 0 else []
+        vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r").reshape(-1, self._dim)
+        rows = [row for _, row in kept]
+        with open(self._path("vectors.f32.tmp"), "wb") as f:
+            for start in range(0, len(rows), 4096):
+                f.write(vectors[rows[start:start + 4096]].tobytes())
+        del vectors
+        with open(self._path("keys.txt.tmp"), "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key, _ in kept)
+        # Without keys.txt the next start discards the directory, so a crash mid-swap can't pair keys with the wrong rows
+        os.remove(self._path("keys.txt"))
+        os.replace(self._path("vectors.f32.tmp"), self._path("vectors.f32"))
+        os.replace(self._path("keys.txt.tmp"), self._path("keys.txt"))
+        self._mmap = None
+        self._rows = OrderedDict((key, row) for row, (key, _) in enumerate(kept))
+        self.compactions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._rows),
+            "disk_compactions": self.compactions,
+        }
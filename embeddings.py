@@ -1,12 +1,221 @@
-import torch
-from sentence_transformers import SentenceTransformer
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from embedding_cache import EmbeddingCache
+import metrics
+
+logger = logging.getLogger(__name__)
 
 # Choose a smaller model for efficiency
 model_name = "sentence-transformers/all-MiniLM-L6-v2"
 
-# Adjust device based on your system configuration
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-embedding_model = SentenceTransformer(model_name, device=device)
+# Which encoder runs behind embed_texts: "torch" (fp32 SentenceTransformer, cuda when available),
+# "onnx" (ONNX Runtime on CPU) or "int8" (dynamically int8-quantized torch model on CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# ONNX export used by the "onnx" backend (the model repository ships fp32 and quantized exports)
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+
+# torch and the model are loaded on first use (or by warm_up) so importing this module is cheap
+device = None
+embedding_model = None
+_model_lock = threading.Lock()
+
+
+def _load_torch():
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    # Adjust device based on your system configuration
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    return SentenceTransformer(model_name, device=device), device
+
+def _load_onnx():
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs={"file_name": EMBEDDING_ONNX_FILE})
+    return model, "cpu"
+
+def _load_int8():
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), "cpu"
+
+# Each loader returns (encoder, device); encoders expose SentenceTransformer.encode
+BACKENDS = {
+    "torch": _load_torch,
+    "onnx": _load_onnx,
+    "int8": _load_int8,
+}
+
+
+def load_backend(name: str):
+    """Load an embedding backend by name; returns (encoder, device)"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def get_model():
+    """Load the configured embedding backend once; callers arriving during the load wait for it"""
+    global device, embedding_model
+    if embedding_model is None:
+        with _model_lock:
+            if embedding_model is None:
+                start = time.perf_counter()
+                embedding_model, device = load_backend(EMBEDDING_BACKEND)
+                logger.info(f"Embedding backend {EMBEDDING_BACKEND} loaded on {device} in {time.perf_counter() - start:.2f}s")
+    return embedding_model
+
+
+def warm_up():
+    """Start loading the embedding model in the background"""
+    thread = threading.Thread(target=get_model, name="embedding-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# Micro-batching: concurrent requests arriving within EMBED_MAX_WAIT_MS are encoded together
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingBatcher:
+    """Background worker that gathers concurrent embedding requests and encodes them as one batch"""
+
+    def __init__(self, encode, max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._requests = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, texts: list[str]) -> Future:
+        """Queue texts for encoding; the future resolves to their embeddings"""
+        future = Future()
+        if not texts:
+            future.set_result([])
+            return future
+        self._ensure_started()
+        self._requests.put((list(texts), future))
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _collect(self):
+        """Block for one request, then keep gathering until the batch is full or the window closes"""
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for request_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+def _encode(texts: list[str]) -> list[list[float]]:
+    model = get_model()
+    with metrics.span("embed_encode_batch"):
+        return model.encode(texts, batch_size=EMBED_MAX_BATCH, show_progress_bar=False).tolist()
+
+
+batcher = EmbeddingBatcher(_encode)
+# Backends produce slightly different vectors, so each gets its own cache namespace
+cache = EmbeddingCache(model_name if EMBEDDING_BACKEND == "torch" else f"{model_name}@{EMBEDDING_BACKEND}")
+
+
+def _lookup(texts):
+    """Split texts into cached vectors and the unique texts that still need encoding"""
+    vectors = cache.get_many(texts)
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    return vectors, missing
+
+def _fill(texts, vectors, missing, computed):
+    cache.put_many(missing, computed)
+    fresh = dict(zip(missing, computed))
+    return [vector if vector is not None else fresh[text] for text, vector in zip(texts, vectors)]
+
+def embed_texts(texts: list[str], cache_results: bool = True) -> list[list[float]]:
+    with metrics.span("embed"):
+        return _embed_texts(texts, cache_results)
+
+def _embed_texts(texts, cache_results):
+    if not cache_results:
+        # One-off bulk work (e.g. imports) would only churn the cache
+        return batcher.submit(texts).result()
+    vectors, missing = _lookup(texts)
+    if not missing:
+        return vectors
+    return _fill(texts, vectors, missing, batcher.submit(missing).result())
+
+async def embed_texts_async(texts: list[str]) -> list[list[float]]:
+    """Embed without blocking the event loop"""
+    with metrics.span("embed"):
+        vectors, missing = _lookup(texts)
+        if not missing:
+            return vectors
+        return _fill(texts, vectors, missing, await asyncio.wrap_future(batcher.submit(missing)))
+
+
+def _benchmark(total=512, concurrency=(1, 8, 32)):
+    """Report throughput and per-request latency, one text per request, unbatched vs batched"""
+    from concurrent.futures import ThreadPoolExecutor
+    texts = [f"benchmark task number {i} about the quarterly report" for i in range(total)]
+    get_model()
+    print(f"device={device} max_batch={EMBED_MAX_BATCH} max_wait={EMBED_MAX_WAIT_MS}ms")
+
+    for label, embed_one in (("unbatched", lambda t: _encode([t])), ("batched", lambda t: embed_texts([t]))):
+        embed_one("warm up")
+        for workers in concurrency:
+            latencies = []
+
+            def timed(text):
+                start = time.perf_counter()
+                embed_one(text)
+                latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(timed, texts))
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            print(f"{label:>9} x{workers:<3} {total / elapsed:8.1f} texts/s  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms")
+
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    return embedding_model.encode(texts, show_progress_bar=False).tolist()
\ No newline at end of file
+if __name__ == "__main__":
+    _benchmark()
@@ -1,38 +1,268 @@
-import requests
+import asyncio
+import contextlib
 import json
+import logging
+import os
+import threading
+import time
 
-def generate_text(prompt: str, max_tokens: int = 1000, temperature: float = 0.7) -> str:
-    """Generate text using Ollama's local Gemma 3:1b model"""
-    # Ollama API endpoint for local models
-    url = "http://localhost:11434/api/generate"
-    
-    # Prepare the request payload
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Ollama connection settings (override through the environment)
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b")
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+# How long Ollama keeps the model loaded after each request (Ollama's own default is 5m; -1 = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Load the model at startup and ping it when idle so nobody waits for a reload (0 to turn off)
+OLLAMA_KEEP_WARM = os.getenv("OLLAMA_KEEP_WARM", "1") == "1"
+# Idle seconds between keep-warm pings (keep it below the keep-alive)
+OLLAMA_PING_INTERVAL = float(os.getenv("OLLAMA_PING_INTERVAL", "240"))
+
+ERROR_MESSAGE = "Error: Could not generate response. Make sure Ollama is running with 'ollama run gemma3:1b'."
+
+
+class OllamaError(Exception):
+    """Ollama answered, but with an error or a response that can't be read (e.g. the model isn't pulled)"""
+
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = {}
+_last_used = 0.0
+_warm_task = None
+
+
+def _build_payload(prompt: str, max_tokens: int, temperature: float, stream: bool, system: str = None) -> dict:
+    """Request body for /api/generate
+
+    A system prompt is placed before the prompt by the model's template, so an unchanging system
+    prompt is a prefix Ollama can reuse from its cache instead of evaluating it again.
+    """
+    global _last_used
+    _last_used = time.monotonic()
     payload = {
-        "model": "gemma3:1b",  # Using local Gemma 3:1b model
+        "model": OLLAMA_MODEL,
         "prompt": prompt,
-        "stream": False,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
         "options": {
             "temperature": temperature,
             "max_tokens": max_tokens
         }
     }
-    
+    if system:
+        payload["system"] = system
+    return payload
+
+
+def _get_session() -> requests.Session:
+    """Return the process-wide keep-alive session used by the blocking client"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                connect=MAX_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=None
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Return the pooled async client bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=OLLAMA_URL,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            transport=httpx.AsyncHTTPTransport(retries=MAX_RETRIES)
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the pooled async client of the running event loop (call on shutdown)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def generate_text(prompt: str, max_tokens: int = 1000, temperature: float = 0.7, system: str = None) -> str:
+    """Generate text using Ollama's local Gemma 3:1b model"""
+    payload = _build_payload(prompt, max_tokens, temperature, stream=False, system=system)
+
     try:
-        # Make the request to Ollama
-        response = requests.post(url, json=payload)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        
+        with metrics.span("generate"):
+            response = _get_session().post(
+                f"{OLLAMA_URL}/api/generate",
+                json=payload,
+                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+            )
+            response.raise_for_status()  # Raise an exception for HTTP errors
+
         # Extract the generated text from the response
         result = response.json()
+        metrics.observe_generation(result)
         return result.get("response", "No response generated")
-    
+
     except requests.exceptions.RequestException as e:
-        print(f"Error generating text: {e}")
-        return f"Error: Could not generate response. Make sure Ollama is running with 'ollama run gemma3:1b'."
+        logger.warning(f"Error generating text: {e}")
+        return ERROR_MESSAGE
+
+
+async def stream_text(prompt: str, max_tokens: int = 1000, temperature: float = 0.7, system: str = None):
+    """Yield response fragments from Ollama as they are generated
+
+    Raises httpx.HTTPError if the request fails and OllamaError if Ollama reports an error mid-stream.
+    """
+    payload = _build_payload(prompt, max_tokens, temperature, stream=True, system=system)
+    client = _get_async_client()
+    start = time.perf_counter()
+    first_token = True
+
+    async with client.stream("POST", "/api/generate", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            try:
+                chunk = json.loads(line)
+            except ValueError as e:
+                raise OllamaError(f"Malformed response line: {line[:200]!r}") from e
+            if chunk.get("error"):
+                raise OllamaError(chunk["error"])
+            if chunk.get("response"):
+                if first_token:
+                    metrics.observe("generate_first_token", time.perf_counter() - start)
+                    first_token = False
+                yield chunk["response"]
+            if chunk.get("done"):
+                metrics.observe("generate", time.perf_counter() - start)
+                metrics.observe_generation(chunk)
+                break
+
+
+async def generate_text_async(prompt: str, max_tokens: int = 1000, temperature: float = 0.7, system: str = None) -> str:
+    """Generate text without blocking the event loop"""
+    payload = _build_payload(prompt, max_tokens, temperature, stream=False, system=system)
+
+    try:
+        with metrics.span("generate"):
+            response = await _get_async_client().post("/api/generate", json=payload)
+            response.raise_for_status()
+        result = response.json()
+        metrics.observe_generation(result)
+        return result.get("response", "No response generated")
+
+    except httpx.HTTPError as e:
+        logger.warning(f"Error generating text: {e}")
+        return ERROR_MESSAGE
+
+
+async def is_loaded() -> bool:
+    """Whether Ollama currently has the model in memory (/api/ps)"""
+    response = await _get_async_client().get("/api/ps")
+    response.raise_for_status()
+    # An untagged model name is listed with Ollama's default ":latest" tag
+    names = {OLLAMA_MODEL, OLLAMA_MODEL if ":" in OLLAMA_MODEL else f"{OLLAMA_MODEL}:latest"}
+    return any(model.get("name") in names or model.get("model") in names for model in response.json().get("models", []))
+
+
+async def ping() -> bool:
+    """Reset the model's keep-alive without generating; True if the model was not loaded and Ollama loaded it"""
+    # Ollama reports done_reason "load" for every empty prompt, so ask /api/ps whether it was loaded
+    was_loaded = await is_loaded()
+    payload = {"model": OLLAMA_MODEL, "prompt": "", "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE}
+    response = await _get_async_client().post("/api/generate", json=payload)
+    response.raise_for_status()
+    return not was_loaded
+
+
+async def preload(system: str = None):
+    """Load the model and, given the shared system prompt, evaluate it once so requests start from the cached prefix"""
+    with metrics.span("model_preload"):
+        await ping()
+        if system:
+            payload = _build_payload("Ready?", 1, 0.0, stream=False, system=system)
+            payload["options"]["num_predict"] = 1
+            # A generation like any other, so it waits for a free slot instead of competing with users
+            async with scheduler.generation():
+                response = await _get_async_client().post("/api/generate", json=payload)
+                response.raise_for_status()
+
+
+async def _keep_warm(system, interval):
+    global _last_used
+    try:
+        await preload(system)
+        logger.info(f"Model {OLLAMA_MODEL} loaded and prompt prefix cached")
+    except httpx.HTTPError as e:
+        logger.warning(f"Model preload failed: {e}")
+    while True:
+        # Requests refresh the keep-alive themselves, so only ping after interval seconds without one
+        idle = time.monotonic() - _last_used
+        if idle < interval:
+            await asyncio.sleep(interval - idle)
+            continue
+        try:
+            if await ping():
+                # Ollama was restarted or evicted the model; the cached prefix went with it
+                logger.info(f"Model {OLLAMA_MODEL} was unloaded; caching the prompt prefix again")
+                await preload(system)
+        except httpx.HTTPError as e:
+            logger.warning(f"Keep-warm ping failed: {e}")
+        _last_used = time.monotonic()
+
+
+def start_keep_warm(system: str = None, interval: float = OLLAMA_PING_INTERVAL):
+    """Preload the model now and keep it loaded while idle (call from the running event loop)"""
+    global _warm_task
+    if _warm_task is None and interval > 0:
+        _warm_task = asyncio.get_running_loop().create_task(_keep_warm(system, interval))
+
+
+async def stop_keep_warm():
+    global _warm_task
+    if _warm_task is not None:
+        _warm_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _warm_task
+        _warm_task = None
+
 
 # Quick test
 if __name__ == "__main__":
     test_prompt = "What is the capital of France?"
     print(f"Testing Gemma with prompt: {test_prompt}")
     response = generate_text(test_prompt)
-    print(f"Response: {response}")
\ No newline at end of file
+    print(f"Response: {response}")
+
+    async def _stream_test():
+        print("Streaming: ", end="", flush=True)
+        async for fragment in stream_text(test_prompt):
+            print(fragment, end="", flush=True)
+        print()
+        await close_async_client()
+
+    asyncio.run(_stream_test())
@@ -0,0 +1,327 @@
+import re
+import threading
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import lexical_index
+import task_index
+from task_index import PRIORITY_ORDER
+from task_manager import add_task, complete_task, query_tasks
+
+# Tasks listed in one reply before the rest are summarised as a count
+MAX_LISTED = 20
+
+# Every slot the router understands, recognised in a single left-to-right scan of the message
+_SLOTS = re.compile(
+    r"(?P<add>^\s*(?:please\s+)?(?:add|new|create)\s+(?:a\s+)?task\b[:\s-]*)"
+    r"|(?P<task_id>\btask_[0-9a-f]{8}\b)"
+    rf"|(?P<priority>\b(?:{'|'.join(PRIORITY_ORDER)})\b)"
+    r"|(?P<range>\btoday\b|\byesterday\b|\b(?:this|last) (?:week|month)\b|\b(?:last|past) (?P<days>\d{1,3}) days\b)"
+    r"|(?P<count>\bhow many\b|\bcount\b|\bnumber of\b)"
+    r"|(?P<open>\bnot done\b|\bneed to\b|\bhave to\b|\bto ?do\b|\b(?:open|pending|incomplete|outstanding|remaining|left)\b)"
+    r"|(?P<completed>\b(?:complete[ds]?|finish(?:ed)?|done|closed)\b)"
+    r"|(?P<added>\b(?:added|created)\b)"
+    r"|(?P<mood>\bmood\b|\bfeel(?:ing)?\b|\bfelt\b)"
+    r"|(?P<list>\b(?:show|list|find)\b|\b(?:what|which) tasks\b)"
+    r"|(?P<task>\btasks?\b)",
+    re.IGNORECASE,
+)
+
+# "complete task_x" / "mark task_x as done"; only imperatives change a task, questions about it never do
+_COMPLETE_COMMAND = re.compile(r"^\s*(?:please\s+)?(?:complete|finish|mark|close)\b", re.IGNORECASE)
+# Questions whose subject is the mood itself ("what was my mood this week", "how have I been feeling")
+_MOOD_SUBJECT = re.compile(
+    r"\b(?:my|average)\s+moods?\b|\bmood\s+(?:scores?|trend|average)\b"
+    r"|\bhow\s+(?:am|are|have|did|was|were)\s+i\s+(?:been\s+)?(?:feel(?:ing)?|felt)\b"
+    r"|\bhow\s+i(?:'m|\s+am|\s+have\s+been|'ve\s+been)\s+feeling\b",
+    re.IGNORECASE,
+)
+# Asking what to do about a mood is a request for advice, which the LLM answers
+_ADVICE = re.compile(r"\b(?:should|could|can|better|improve|help|advice|tips?|ways?|why|makes?|causes?)\b", re.IGNORECASE)
+
+# Words that carry no topic when asking about tasks
+_FILLER = {
+    "did", "does", "have", "has", "had", "be", "been", "was", "were", "can", "could", "there", "that", "this",
+    "still", "yet", "so", "far", "up", "by", "you", "your", "it", "how", "many", "much", "am", "me", "ones",
+    "give", "tell", "whats", "s", "as", "mark",
+}
+
+
+@dataclass
+class Intent:
+    """A message the router can answer without the LLM"""
+    name: str                 # add, complete, status, count, list, search or mood
+    text: str = ""
+    task_id: str = None
+    priority: str = None
+    completed: bool = None
+    since: str = None         # YYYY-MM-DD, inclusive
+    until: str = None         # YYYY-MM-DD, exclusive
+    range_label: str = None
+    date_field: str = "created_at"
+
+
+def date_range(phrase, days=None, today=None):
+    """(since, until) ISO dates for a range phrase such as "yesterday" or "last 7 days"; until is exclusive"""
+    today = today or date.today()
+    tomorrow = today + timedelta(days=1)
+    phrase = phrase.lower()
+    if phrase == "today":
+        start, end = today, tomorrow
+    elif phrase == "yesterday":
+        start, end = today - timedelta(days=1), today
+    elif phrase == "this week":
+        start, end = today - timedelta(days=today.weekday()), tomorrow
+    elif phrase == "last week":
+        end = today - timedelta(days=today.weekday())
+        start = end - timedelta(days=7)
+    elif phrase == "this month":
+        start, end = today.replace(day=1), tomorrow
+    elif phrase == "last month":
+        end = today.replace(day=1)
+        start = (end - timedelta(days=1)).replace(day=1)
+    else:
+        start, end = tomorrow - timedelta(days=int(days)), tomorrow
+    return start.isoformat(), end.isoformat()
+
+
+def parse(text):
+    """Slots found in the message, keyed by slot name (first occurrence wins)"""
+    slots = {}
+    for match in _SLOTS.finditer(text):
+        name = "range" if match.lastgroup == "days" else match.lastgroup
+        slots.setdefault(name, match)
+    return slots
+
+
+def _content_terms(text):
+    """Words of the message that are neither slots nor filler, i.e. a topic to search for"""
+    return [term for term in lexical_index.query_terms(_SLOTS.sub(" ", text)) if term not in _FILLER]
+
+
+def route(text):
+    """Map a message to an Intent, or None if it needs the LLM"""
+    slots = parse(text)
+
+    if "add" in slots:
+        body = text[slots["add"].end():].strip()
+        return Intent("add", text=body) if body else None
+    if "task_id" in slots and "completed" in slots:
+        task_id = slots["task_id"].group(0).lower()
+        if "?" not in text and _COMPLETE_COMMAND.match(text):
+            return Intent("complete", task_id=task_id)
+        # "Did I complete task_x?" / "Is task_x done?" only reads the task
+        return Intent("status", task_id=task_id)
+
+    intent = Intent("list")
+    if "priority" in slots:
+        intent.priority = slots["priority"].group(0).lower()
+    # "what do I need to complete" asks about open tasks, so an open marker wins over a completed one
+    if "open" in slots:
+        intent.completed = False
+    elif "completed" in slots:
+        intent.completed = True
+    # A date range means the completion date for completed tasks and the creation date for "added"
+    if "range" in slots and (intent.completed or "added" in slots or "mood" in slots):
+        match = slots["range"]
+        intent.range_label = match.group("range").lower()
+        intent.since, intent.until = date_range(intent.range_label, match.group("days"))
+        intent.date_field = "completed_at" if intent.completed and "added" not in slots else "created_at"
+
+    if "mood" in slots and "task" not in slots:
+        # Only questions about the mood itself; "I felt great today" and "how do I feel better?" go to the LLM
+        if "?" not in text and not text.lower().lstrip().startswith(("how", "what", "show")):
+            return None
+        if not _MOOD_SUBJECT.search(text) or _ADVICE.search(text):
+            return None
+        intent.name = "mood"
+        if intent.range_label is None:
+            intent.range_label = "this week"
+            intent.since, intent.until = date_range(intent.range_label)
+        return intent
+
+    content = _content_terms(text)
+    if "count" in slots and ("task" in slots or "priority" in slots):
+        intent.name = "count"
+        return None if content else intent
+    if "list" in slots:
+        if content:
+            intent.name = "search"
+            intent.text = text
+        return intent
+    if content:
+        return None
+    if "task" in slots or "priority" in slots or intent.range_label:
+        return intent
+    return None
+
+
+_stats = {"routed": 0, "total": 0}
+_intent_counts = {}
+_stats_lock = threading.Lock()
+
+
+def record(intent):
+    """Count one routed message (or, for None, one that goes to the LLM)"""
+    with _stats_lock:
+        _stats["total"] += 1
+        if intent is not None:
+            _stats["routed"] += 1
+            _intent_counts[intent.name] = _intent_counts.get(intent.name, 0) + 1
+
+
+def stats() -> dict:
+    with _stats_lock:
+        total = _stats["total"]
+        return {
+            "routed": _stats["routed"],
+            "total": total,
+            "hit_rate": _stats["routed"] / total if total else 0.0,
+            "intents": dict(_intent_counts),
+        }
+
+
+def _describe(intent):
+    words = []
+    if intent.completed is True:
+        words.append("completed")
+    elif intent.completed is False:
+        words.append("open")
+    if intent.priority:
+        words.append(intent.priority.upper())
+    return " ".join(words + ["tasks"])
+
+
+def _when(intent):
+    if not intent.range_label:
+        return ""
+    if intent.range_label.endswith("days"):
+        return f" in the {intent.range_label}"
+    return f" {intent.range_label}"
+
+
+def _format_tasks(ids, documents, metadatas, total):
+    response = "Here are your tasks:\n\n"
+    for i, (doc, meta, item_id) in enumerate(zip(documents, metadatas, ids)):
+        status = "✓ DONE" if meta.get("completed", False) else "◯ PENDING"
+        priority = f"[{meta.get('priority_code', 'Unknown').upper()}]" if meta.get("priority_code") else ""
+        response += f"{i+1}. {status} {priority} {doc}\nID: {item_id}\n\n"
+    if total > len(ids):
+        response += f"...and {total - len(ids)} more."
+    return response
+
+
+def _status_answer(task_id, owner):
+    metadata = task_index.get_metadata(task_id, owner)
+    if metadata is None or metadata.get("type", "task") != "task":
+        return "Task not found"
+    if metadata.get("completed"):
+        completed_at = metadata.get("completed_at")
+        return f"Yes, {task_id} is completed{f' (on {completed_at[:10]})' if completed_at else ''}."
+    return f"No, {task_id} is still open. Send \"complete {task_id}\" to mark it done."
+
+
+def _period(range_label, today=None):
+    """(aggregate period, a day inside it) for a named range such as "this week"; None otherwise"""
+    today = today or date.today()
+    periods = {
+        "today": ("day", today),
+        "yesterday": ("day", today - timedelta(days=1)),
+        "this week": ("week", today),
+        "last week": ("week", today - timedelta(days=7)),
+        "this month": ("month", today),
+        "last month": ("month", today.replace(day=1) - timedelta(days=1)),
+    }
+    return periods.get(range_label)
+
+
+def _mood_answer(intent, owner):
+    """Mood for the asked range straight from the aggregates, with the change since the period before"""
+    period = _period(intent.range_label)
+    if period is None:
+        mood, change = task_index.mood_stats(owner, intent.since, intent.until), None
+    else:
+        trend = task_index.mood_trend(owner, *period)
+        mood, change = trend["current"], trend["change"]
+    if not mood["count"]:
+        return f"No mood scores recorded{_when(intent)}."
+    response = (f"Your average mood{_when(intent)} was {mood['mean']:.1f}/10 over {mood['count']} "
+                f"reflection{'s' if mood['count'] != 1 else ''} (lowest {mood['min']:g}, highest {mood['max']:g})")
+    if change is not None:
+        direction = "up" if change > 0 else "down" if change < 0 else "unchanged"
+        response += f", {direction}{f' {abs(change):.1f}' if change else ''} from the {period[0]} before"
+    return response + "."
+
+
+def answer(intent, owner=None) -> str:
+    """Carry out an intent against the owner's data and return the reply text"""
+    if intent.name == "add":
+        task_id, metadata = add_task(intent.text, owner=owner)
+        return f"Task added! ID: {task_id}\nPriority: {metadata.get('priority_description', 'Not specified')}"
+
+    if intent.name == "complete":
+        success, message = complete_task(intent.task_id, owner=owner)
+        return message
+
+    if intent.name == "status":
+        return _status_answer(intent.task_id, owner)
+
+    if intent.name == "mood":
+        return _mood_answer(intent, owner)
+
+    if intent.name == "search":
+        filter_metadata = {}
+        if intent.priority:
+            filter_metadata["priority_code"] = intent.priority
+        if intent.completed is not None:
+            filter_metadata["completed"] = intent.completed
+        results = query_tasks(intent.text, filter_metadata=filter_metadata, owner=owner)
+        if not results["documents"] or len(results["documents"][0]) == 0:
+            return "No matching tasks found."
+        return _format_tasks(results["ids"][0], results["documents"][0], results["metadatas"][0], len(results["ids"][0]))
+
+    filters = dict(owner=owner, priority=intent.priority, completed=intent.completed,
+                   since=intent.since, until=intent.until, date_field=intent.date_field)
+    count = task_index.count_tasks(**filters)
+    if intent.name == "count":
+        if intent.completed and intent.date_field == "completed_at":
+            return f"You completed {count} {_describe(intent).replace('completed ', '')}{_when(intent)}."
+        return f"You have {count} {_describe(intent)}{_when(intent)}."
+
+    if not count:
+        return f"No {_describe(intent)}{_when(intent)}."
+    results = task_index.find_tasks(**filters, limit=MAX_LISTED)
+    return _format_tasks(results["ids"], results["documents"], results["metadatas"], count)
+
+
+if __name__ == "__main__":
+    # Routing checks; route() only parses the text, so no store is touched
+    cases = [
+        ("complete task_abcdef12", "complete"),
+        ("Please mark task_abcdef12 as done", "complete"),
+        ("finish task_abcdef12", "complete"),
+        ("Did I complete task_abcdef12?", "status"),
+        ("Is task_abcdef12 done?", "status"),
+        ("Have I finished task_abcdef12 yet?", "status"),
+        ("did i complete task_abcdef12", "status"),
+        ("complete task_abcdef12?", "status"),
+        ("What was my mood this week?", "mood"),
+        ("How am I feeling this week?", "mood"),
+        ("How am I feeling?", "mood"),
+        ("Show me how I'm feeling this month", "mood"),
+        ("How have I been feeling last month?", "mood"),
+        ("show my average mood last week", "mood"),
+        ("I feel tired, what should I do?", None),
+        ("How do I feel better?", None),
+        ("What makes me feel productive?", None),
+        ("Why was my mood so low this week?", None),
+        ("I felt great today", None),
+    ]
+    failures = 0
+    for text, expected in cases:
+        intent = route(text)
+        name = intent.name if intent else None
+        if name != expected:
+            failures += 1
+            print(f"❌ {text!r}: expected {expected}, got {name}")
+    print(f"{'✅' if not failures else '❌'} {len(cases) - failures}/{len(cases)} routing checks passed")
@@ -0,0 +1,165 @@
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import task_index
+from task_index import PRIORITY_ORDER
+
+# BM25 term-frequency saturation and length normalisation
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Reciprocal-rank fusion constant (higher = flatter blend of the two rankings)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+ID_PATTERN = re.compile(r"\b(?:task|reflection)_[0-9a-f]{8}\b")
+# Words that say nothing about which item is wanted, including the bot's own query phrasing
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "for", "in", "on", "at", "with", "about", "is", "are",
+    "i", "me", "my", "what", "which", "any", "anything", "all", "do", "did", "please",
+    "show", "find", "list", "task", "tasks", "completed", "incomplete", "not", "done",
+}
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def query_terms(query):
+    return [term for term in tokenize(query) if term not in STOPWORDS]
+
+
+def is_keyword_query(query) -> bool:
+    """Task ids, bare priority words and single keywords are answered without embedding the query"""
+    if ID_PATTERN.search(query.lower()):
+        return True
+    terms = query_terms(query)
+    return bool(terms) and (len(terms) == 1 or all(term in PRIORITY_ORDER for term in terms))
+
+
+def fuse(*rankings, k=RRF_K):
+    """Reciprocal-rank fusion of several ranked id lists, best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def _matches(metadata, filters):
+    return all(metadata.get(key) == value for key, value in filters.items())
+
+
+class _OwnerIndex:
+    """BM25 inverted index over one chat's documents"""
+
+    def __init__(self):
+        self.docs = {}      # id -> (term counts, length, document, metadata)
+        self.postings = {}  # term -> {id: term frequency}
+        self.total_length = 0
+
+    def add(self, item_id, document, metadata):
+        self.remove(item_id)
+        terms = Counter(tokenize(document))
+        # The id and priority code are searchable too, even when the text does not mention them
+        terms[item_id.lower()] += 1
+        if metadata.get("priority_code"):
+            terms[metadata["priority_code"]] += 1
+        length = sum(terms.values())
+        self.docs[item_id] = (terms, length, document, metadata)
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[item_id] = frequency
+
+    def remove(self, item_id):
+        entry = self.docs.pop(item_id, None)
+        if entry is None:
+            return
+        self.total_length -= entry[1]
+        for term in entry[0]:
+            posting = self.postings[term]
+            del posting[item_id]
+            if not posting:
+                del self.postings[term]
+
+    def set_metadata(self, item_id, metadata):
+        entry = self.docs.get(item_id)
+        if entry is not None:
+            self.docs[item_id] = entry[:3] + (metadata,)
+
+    def search(self, terms, k, filters):
+        count = len(self.docs)
+        if not count:
+            return []
+        average_length = self.total_length / count
+        scores = {}
+        for term in set(terms):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for item_id, frequency in posting.items():
+                length = self.docs[item_id][1]
+                norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                scores[item_id] = scores.get(item_id, 0.0) + idf * frequency * (BM25_K1 + 1) / norm
+        candidates = ((score, item_id) for item_id, score in scores.items() if _matches(self.docs[item_id][3], filters))
+        return [(item_id, self.docs[item_id][2], self.docs[item_id][3]) for _, item_id in heapq.nlargest(k, candidates)]
+
+
+# owner -> _OwnerIndex, built from task_index the first time the chat is searched
+_indexes = {}
+_lock = threading.Lock()
+
+
+def _index(owner):
+    index = _indexes.get(owner)
+    if index is None:
+        index = _OwnerIndex()
+        items = task_index.all_items(owner)
+        for item_id, document, metadata in zip(items["ids"], items["documents"], items["metadatas"]):
+            index.add(item_id, document, metadata)
+        _indexes[owner] = index
+    return index
+
+
+def add_items(ids, documents, metadatas, owner=None):
+    """Mirror documents just written to task_index (chats not searched yet are built on demand instead)"""
+    with _lock:
+        index = _indexes.get(owner)
+        if index is not None:
+            for item_id, document, metadata in zip(ids, documents, metadatas):
+                index.add(item_id, document, metadata)
+
+
+def remove_items(ids, owner=None):
+    """Drop documents that left the searched collection, e.g. when they were archived"""
+    with _lock:
+        index = _indexes.get(owner)
+        if index is not None:
+            for item_id in ids:
+                index.remove(item_id)
+
+
+def update_metadata(item_id, metadata, owner=None):
+    with _lock:
+        index = _indexes.get(owner)
+        if index is not None:
+            index.set_metadata(item_id, metadata)
+
+
+def search(query, k=5, filters=None, owner=None):
+    """Top-k (id, document, metadata) by BM25 among the owner's items matching the metadata filters"""
+    terms = query_terms(query)
+    if not terms:
+        return []
+    with _lock:
+        return _index(owner).search(terms, k, filters or {})
+
+
+def reset():
+    """Forget every loaded chat, e.g. after task_index was rebuilt"""
+    with _lock:
+        _indexes.clear()
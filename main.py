@@ -1,33 +1,38 @@
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
 
-def check_requirements():
-    """Check if necessary components are set up before starting"""
-    # Check if TELEGRAM_TOKEN is set
+def check_token():
+    """Check that TELEGRAM_TOKEN is set"""
     if not os.getenv("TELEGRAM_TOKEN"):
         print("⚠️ TELEGRAM_TOKEN environment variable not set.")
         print("Please set it with:")
         print("  - Linux/Mac: export TELEGRAM_TOKEN='your_token_here'")
         print("  - Windows: set TELEGRAM_TOKEN=your_token_here")
         return False
-    
-    # Check if Ollama is likely running
+    return True
+
+def check_ollama(timeout=2.0):
+    """Check if Ollama is likely running (a TCP connect, no generation)"""
     import socket
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     try:
-        s.connect(("localhost", 11434))
-        s.close()
-    except:
+        socket.create_connection(("localhost", 11434), timeout=timeout).close()
+    except OSError:
         print("⚠️ Ollama doesn't appear to be running on localhost:11434.")
         print("Please start Ollama with:")
         print("  ollama run gemma3:1b")
         return False
-    
     return True
 
+def check_requirements():
+    """Check if necessary components are set up before starting"""
+    return check_token() and check_ollama()
+
 def setup_database():
     """Initialize the database and other components"""
     from db_setup import get_chroma_collection
@@ -49,11 +54,58 @@ def test_gemma():
         print("Make sure Ollama is running with: ollama run gemma3:1b")
         return False
 
+@contextmanager
+def timed_phase(name, timings):
+    """Record and print how long a startup phase took"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+        print(f"⏱  {name}: {timings[name]:.2f}s")
+
+def fast_start():
+    """Start serving as soon as possible: probes run concurrently, heavy models load in the background
+
+    Requests that need the embedding model before it has loaded wait for it instead of failing.
+    """
+    timings = {}
+    startup = time.perf_counter()
+    
+    if not check_token():
+        return False
+    
+    with timed_phase("imports", timings):
+        import telegram_bot
+        import embeddings
+    
+    # The embedding model loads while the probes run and the bot starts polling
+    embeddings.warm_up()
+    
+    with timed_phase("readiness probes", timings):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            ollama_ready = pool.submit(check_ollama)
+            database_ready = pool.submit(setup_database)
+            if not (ollama_ready.result() and database_ready.result()):
+                return False
+    
+    print(f"⏱  ready to serve after {time.perf_counter() - startup:.2f}s")
+    print("\n✅ Starting Telegram bot (embedding model warming up in the background)...\n")
+    telegram_bot.main()
+    return True
+
 if __name__ == "__main__":
     print("=" * 50)
     print("Starting Halsey - GemmaRAG Personal Assistant")
     print("=" * 50)
     
+    # `python main.py --fast` (or STARTUP_MODE=fast) skips the test generation and defers model loading
+    if "--fast" in sys.argv or os.getenv("STARTUP_MODE") == "fast":
+        if not fast_start():
+            print("\n❌ Setup checks failed. Please fix the issues above and try again.")
+            sys.exit(1)
+        sys.exit(0)
+    
     if not check_requirements():
         print("\n❌ Setup checks failed. Please fix the issues above and try again.")
         sys.exit(1)
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set METRICS_ENABLED=0 to turn every span into a shared no-op context manager
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Port for the Prometheus-style /metrics endpoint (unset = no endpoint); bound to localhost only
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds of the generation speed histogram buckets (tokens/sec)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200, 500, 1000)
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Cumulative bucketed histogram, safe to update from worker threads"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the usual Prometheus approximation)"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+# (metric family, stage label) -> Histogram
+_histograms = {}
+_registry_lock = threading.Lock()
+
+
+def _histogram(family, stage, buckets):
+    key = (family, stage)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _registry_lock:
+            histogram = _histograms.setdefault(key, Histogram(buckets))
+    return histogram
+
+
+def observe(stage, seconds):
+    """Record a stage latency"""
+    if METRICS_ENABLED:
+        _histogram("halsey_stage_seconds", stage, LATENCY_BUCKETS).observe(seconds)
+
+
+def observe_generation(chunk):
+    """Record generation speed from the eval_count/eval_duration fields of Ollama's final response"""
+    if not METRICS_ENABLED:
+        return
+    eval_count = chunk.get("eval_count")
+    eval_duration = chunk.get("eval_duration")
+    if eval_count and eval_duration:
+        _histogram("halsey_generation_tokens_per_second", "eval", TOKEN_RATE_BUCKETS).observe(eval_count / (eval_duration / 1e9))
+    prompt_count = chunk.get("prompt_eval_count")
+    prompt_duration = chunk.get("prompt_eval_duration")
+    if prompt_count and prompt_duration:
+        _histogram("halsey_generation_tokens_per_second", "prompt_eval", TOKEN_RATE_BUCKETS).observe(prompt_count / (prompt_duration / 1e9))
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def span(stage):
+    """Time a block: `with span("chroma_query"): ...`"""
+    return _Span(stage) if METRICS_ENABLED else _NOOP
+
+
+def _snapshot():
+    """Registered histograms, sorted; other threads may register new stages while this is iterated"""
+    with _registry_lock:
+        return sorted(_histograms.items())
+
+
+def render_prometheus() -> str:
+    """All histograms in the Prometheus text exposition format"""
+    lines = []
+    items = _snapshot()
+    families = sorted({family for (family, _), _ in items})
+    for family in families:
+        lines.append(f"# TYPE {family} histogram")
+        for (name, stage), histogram in items:
+            if name != family:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{family}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{family}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{family}_sum{{stage="{stage}"}} {histogram.total}')
+            lines.append(f'{family}_count{{stage="{stage}"}} {histogram.count}')
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> str:
+    """Human-readable per-stage summary for the /stats command"""
+    if not METRICS_ENABLED:
+        return "Metrics are disabled (METRICS_ENABLED=0)."
+    lines = []
+    for (family, stage), h in _snapshot():
+        if not h.count:
+            continue
+        if family == "halsey_stage_seconds":
+            lines.append(f"{stage}: n={h.count} mean={h.total / h.count * 1000:.1f}ms "
+                         f"p50≤{h.quantile(0.5) * 1000:g}ms p95≤{h.quantile(0.95) * 1000:g}ms")
+        else:
+            lines.append(f"{stage} tokens/s: n={h.count} mean={h.total / h.count:.1f}")
+    return "\n".join(lines) if lines else "No measurements yet."
+
+
+def start_http_server(port=None):
+    """Serve /metrics on localhost in a daemon thread; returns the server or None when no port is configured"""
+    port = port or METRICS_PORT
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Maximum number of (user, day) plans kept in memory
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+
+_plans = OrderedDict()
+_lock = threading.Lock()
+hits = 0
+misses = 0
+
+
+def fingerprint(*results) -> str:
+    """Hash the Chroma get()-shaped results (ids, text and metadata) and summary strings a plan was built from"""
+    digest = hashlib.sha256()
+    for result in results:
+        if isinstance(result, str):
+            digest.update(result.encode("utf-8") + b"\0")
+            continue
+        for item_id, doc, meta in zip(result["ids"], result["documents"], result["metadatas"]):
+            digest.update(json.dumps([item_id, doc, meta], sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get(user, day, state_fingerprint):
+    """Return the memoized plan if it was built from exactly this state"""
+    global hits, misses
+    with _lock:
+        entry = _plans.get((user, day))
+        if entry is not None and entry[0] == state_fingerprint:
+            _plans.move_to_end((user, day))
+            hits += 1
+            return entry[1]
+        misses += 1
+        return None
+
+
+def put(user, day, state_fingerprint, plan):
+    with _lock:
+        # A user only ever needs today's plan
+        for key in [key for key in _plans if key[0] == user and key[1] != day]:
+            del _plans[key]
+        _plans[(user, day)] = (state_fingerprint, plan)
+        _plans.move_to_end((user, day))
+        while len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+
+
+def invalidate(user=None):
+    """Drop memoized plans for one user, or for everyone when user is None"""
+    with _lock:
+        if user is None:
+            _plans.clear()
+            return
+        for key in [key for key in _plans if key[0] == user]:
+            del _plans[key]
@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+
+import metrics
+
+# Generations Ollama is asked to run at once (a single CPU instance is fastest one at a time)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "1"))
+# Generations allowed to wait silently; later ones are told their queue position right away
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "2"))
+
+DUPLICATE_MESSAGE = "Already working on that - the answer will appear in my earlier message."
+
+# The chat turn held by the handler running in the current task
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class _ChatTurn:
+    """One update's exclusive turn in its chat; released at most once"""
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.held = False
+
+    async def acquire(self):
+        await self.lock.acquire()
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.lock.release()
+
+
+class Scheduler:
+    """Per-chat FIFO ordering of updates, and a global bounded queue for LLM generations
+
+    Each chat's updates start in arrival order and run one at a time until they either finish or
+    reach the generation step. Generation waits for one of max_concurrency slots without holding
+    the chat, so cheap commands never queue behind the model. Identical requests still in flight
+    in the same chat are answered once.
+    """
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, queue_limit=LLM_QUEUE_LIMIT):
+        self.max_concurrency = max_concurrency
+        self.queue_limit = queue_limit
+        self.waiting = 0
+        self.running = 0
+        self.coalesced = 0
+        self._slots = None
+        self._chats = {}       # chat id -> [asyncio.Lock, number of updates using it]
+        self._in_flight = set()
+
+    def _gate(self):
+        # Created on first use so it belongs to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    @asynccontextmanager
+    async def _chat_turn(self, chat_id):
+        entry = self._chats.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        turn = _ChatTurn(entry[0])
+        token = _current_turn.set(turn)
+        try:
+            await turn.acquire()
+            yield turn
+        finally:
+            turn.release()
+            _current_turn.reset(token)
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[chat_id]
+
+    def handler(self, callback, coalesce=False):
+        """Wrap a PTB callback so it runs in its chat's order (and, with coalesce, at most once per identical text)"""
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            chat = update.effective_chat
+            if chat is None:
+                return await callback(update, context)
+            async with self._chat_turn(chat.id):
+                key = None
+                if coalesce and update.effective_message is not None:
+                    key = (chat.id, callback.__name__, (update.effective_message.text or "").strip().lower())
+                    if key in self._in_flight:
+                        self.coalesced += 1
+                        await update.effective_message.reply_text(DUPLICATE_MESSAGE)
+                        return
+                    self._in_flight.add(key)
+                try:
+                    return await callback(update, context)
+                finally:
+                    self._in_flight.discard(key)
+        return wrapper
+
+    @asynccontextmanager
+    async def generation(self, notify_queued=None):
+        """Hold one LLM slot; hands the chat over to its next update while queued and generating
+
+        notify_queued(position) is awaited when the wait starts beyond the queue limit.
+        """
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.release()
+
+        gate = self._gate()
+        position = self.waiting + 1 if gate.locked() else 0
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            if position > self.queue_limit and notify_queued is not None:
+                await notify_queued(position)
+            await gate.acquire()
+        finally:
+            self.waiting -= 1
+        metrics.observe("llm_queue_wait", time.perf_counter() - start)
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            gate.release()
+
+    def stats(self) -> dict:
+        return {"running": self.running, "waiting": self.waiting, "coalesced": self.coalesced, "chats": len(self._chats)}
+
+
+scheduler = Scheduler()
@@ -0,0 +1,480 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+# SQLite file holding the structured copy of task/reflection metadata
+TASK_INDEX_PATH = os.getenv("TASK_INDEX_PATH", "./task_index.sqlite3")
+
+# Order in which open tasks are presented (most pressing first)
+PRIORITY_ORDER = ["ferrari", "tesla", "amazon", "suzuki", "orange", "greyhound", "budweiser"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    owner TEXT NOT NULL,
+    id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    document TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    priority_code TEXT,
+    created_at TEXT,
+    metadata TEXT NOT NULL,
+    archived INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (owner, id)
+);
+CREATE INDEX IF NOT EXISTS idx_items_open ON items (owner, type, completed, priority_code, created_at);
+CREATE INDEX IF NOT EXISTS idx_items_recent ON items (owner, type, created_at);
+CREATE TABLE IF NOT EXISTS mood_aggregates (
+    owner TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    mood_sum REAL NOT NULL,
+    min_mood REAL NOT NULL,
+    max_mood REAL NOT NULL,
+    PRIMARY KEY (owner, period, bucket)
+);
+CREATE TABLE IF NOT EXISTS reflection_rollups (
+    owner TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    mood_sum REAL NOT NULL,
+    mood_count INTEGER NOT NULL,
+    first_date TEXT,
+    last_date TEXT
+);
+"""
+
+_UPSERT = (
+    "INSERT OR REPLACE INTO items (owner, id, type, document, completed, priority_code, created_at, metadata, archived) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Folds one new reflection into its owner's rolling summary
+_ROLLUP_ADD = (
+    "INSERT INTO reflection_rollups (owner, count, mood_sum, mood_count, first_date, last_date) "
+    "VALUES (?, 1, ?, ?, ?, ?) "
+    "ON CONFLICT(owner) DO UPDATE SET "
+    "count = count + 1, "
+    "mood_sum = mood_sum + excluded.mood_sum, "
+    "mood_count = mood_count + excluded.mood_count, "
+    "first_date = min(coalesce(first_date, excluded.first_date), coalesce(excluded.first_date, first_date)), "
+    "last_date = max(coalesce(last_date, excluded.last_date), coalesce(excluded.last_date, last_date))"
+)
+
+# Folds one mood score into a day/week/month aggregate
+_MOOD_ADD = (
+    "INSERT INTO mood_aggregates (owner, period, bucket, count, mood_sum, min_mood, max_mood) "
+    "VALUES (?, ?, ?, 1, ?, ?, ?) "
+    "ON CONFLICT(owner, period, bucket) DO UPDATE SET "
+    "count = count + 1, "
+    "mood_sum = mood_sum + excluded.mood_sum, "
+    "min_mood = min(min_mood, excluded.min_mood), "
+    "max_mood = max(max_mood, excluded.max_mood)"
+)
+# Takes one reflection's score back out of an aggregate (min/max are recomputed afterwards)
+_MOOD_REMOVE = (
+    "UPDATE mood_aggregates SET count = count - 1, mood_sum = mood_sum - ? "
+    "WHERE owner = ? AND period = ? AND bucket = ?"
+)
+_ROLLUP_REMOVE = (
+    "UPDATE reflection_rollups SET count = count - 1, mood_sum = mood_sum - ?, mood_count = mood_count - ? "
+    "WHERE owner = ?"
+)
+# A reflection's day in SQL, matching _reflection_day
+_REFLECTION_DAY_SQL = "coalesce(nullif(json_extract(metadata, '$.date'), ''), substr(created_at, 1, 10))"
+MOOD_PERIODS = ("day", "week", "month")
+
+_conn = None
+_lock = threading.RLock()
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        with _lock:
+            if _conn is None:
+                conn = sqlite3.connect(TASK_INDEX_PATH, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                # The index is rebuilt from Chroma at startup, so an outdated layout is simply dropped
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(items)")]
+                if columns and ("owner" not in columns or "archived" not in columns):
+                    conn.execute("DROP TABLE items")
+                conn.executescript(_SCHEMA)
+                _conn = conn
+    return _conn
+
+
+def _owner_key(owner):
+    """Chats are stored by id; the shared pre-tenant collection uses an empty owner"""
+    return "" if owner is None else str(owner)
+
+
+def _row(owner, item_id, document, metadata, archived=False):
+    return (
+        _owner_key(owner),
+        item_id,
+        metadata.get("type", "unknown"),
+        document,
+        1 if metadata.get("completed") else 0,
+        metadata.get("priority_code"),
+        metadata.get("created_at"),
+        json.dumps(metadata),
+        1 if archived else 0,
+    )
+
+
+def _results(rows):
+    """Shape rows like a Chroma get() result"""
+    results = {"ids": [], "documents": [], "metadatas": []}
+    for item_id, document, metadata in rows:
+        results["ids"].append(item_id)
+        results["documents"].append(document)
+        results["metadatas"].append(json.loads(metadata))
+    return results
+
+
+def mood_bucket(period, day):
+    """Aggregate key of the period containing day: 2026-10-18, 2026-W42 (ISO week) or 2026-10"""
+    if period == "day":
+        return day.isoformat()
+    if period == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime("%Y-%m")
+
+
+def period_days(period, day):
+    """(first day, day after the last) of the period containing day"""
+    if period == "day":
+        return day, day + timedelta(days=1)
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    start = day.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def previous_period_day(period, day):
+    """A day inside the period before the one containing day"""
+    if period == "day":
+        return day - timedelta(days=1)
+    if period == "week":
+        return day - timedelta(days=7)
+    return day.replace(day=1) - timedelta(days=1)
+
+
+def _reflection_day(metadata):
+    try:
+        return date.fromisoformat(metadata.get("date") or (metadata.get("created_at") or "")[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+def _mood_rows(owner_key, metadata):
+    """One aggregate update per period for a reflection with a mood score"""
+    mood = metadata.get("mood_score")
+    day = _reflection_day(metadata)
+    if mood is None or day is None:
+        return []
+    mood = float(mood)
+    return [(owner_key, period, mood_bucket(period, day), mood, mood, mood) for period in MOOD_PERIODS]
+
+
+def _rollup_row(owner_key, metadata):
+    mood = metadata.get("mood_score")
+    date = metadata.get("date") or (metadata.get("created_at") or "")[:10] or None
+    return (owner_key, float(mood) if mood is not None else 0.0, 1 if mood is not None else 0, date, date)
+
+
+def upsert_items(ids, documents, metadatas, owner=None):
+    """Mirror documents just written to Chroma"""
+    conn = _connection()
+    owner_key = _owner_key(owner)
+    with _lock, conn:
+        previous = {}
+        for item_id in ids:
+            row = conn.execute("SELECT metadata FROM items WHERE owner = ? AND id = ?", (owner_key, item_id)).fetchone()
+            if row is not None:
+                previous[item_id] = json.loads(row[0])
+
+        # Reflections are folded into the rolling summary and the day/week/month mood aggregates, a constant
+        # number of row updates each. A reflection written again (re-import, write-log replay) first has its
+        # old score taken back out, so a changed mood or date does not leave the aggregates stale.
+        added, removed = [], []
+        for item_id, meta in zip(ids, metadatas):
+            old = previous.get(item_id)
+            if old is not None and old.get("type") == "reflection":
+                if meta.get("type") == "reflection" and _mood_key(old) == _mood_key(meta):
+                    continue
+                removed.append(old)
+            if meta.get("type") == "reflection":
+                added.append(meta)
+        for meta in removed:
+            mood = meta.get("mood_score")
+            conn.execute(_ROLLUP_REMOVE, (float(mood) if mood is not None else 0.0, 1 if mood is not None else 0, owner_key))
+            conn.executemany(_MOOD_REMOVE, [(mood, key, period, bucket) for key, period, bucket, mood, _, _ in _mood_rows(owner_key, meta)])
+        conn.executemany(_ROLLUP_ADD, [_rollup_row(owner_key, meta) for meta in added])
+        conn.executemany(_MOOD_ADD, [row for meta in added for row in _mood_rows(owner_key, meta)])
+        conn.executemany(
+            _UPSERT,
+            [_row(owner, item_id, doc, meta) for item_id, doc, meta in zip(ids, documents, metadatas)]
+        )
+        if removed:
+            _refresh_extremes(conn, owner_key, removed)
+
+
+def _mood_key(metadata):
+    """What a reflection contributes to the aggregates"""
+    return metadata.get("mood_score"), _reflection_day(metadata)
+
+
+def _refresh_extremes(conn, owner_key, removed):
+    """Recompute what a removed score may have changed: bucket min/max and the rollup's date range"""
+    buckets = set()
+    for meta in removed:
+        day = _reflection_day(meta)
+        if meta.get("mood_score") is not None and day is not None:
+            buckets.update((period, mood_bucket(period, day), day) for period in MOOD_PERIODS)
+    for period, bucket, day in buckets:
+        start, end = period_days(period, day)
+        low, high = conn.execute(
+            "SELECT min(json_extract(metadata, '$.mood_score')), max(json_extract(metadata, '$.mood_score')) "
+            f"FROM items WHERE owner = ? AND type = 'reflection' AND json_extract(metadata, '$.mood_score') IS NOT NULL "
+            f"AND {_REFLECTION_DAY_SQL} >= ? AND {_REFLECTION_DAY_SQL} < ?",
+            (owner_key, start.isoformat(), end.isoformat())
+        ).fetchone()
+        if low is None:
+            conn.execute("DELETE FROM mood_aggregates WHERE owner = ? AND period = ? AND bucket = ?", (owner_key, period, bucket))
+        else:
+            conn.execute(
+                "UPDATE mood_aggregates SET min_mood = ?, max_mood = ? WHERE owner = ? AND period = ? AND bucket = ?",
+                (float(low), float(high), owner_key, period, bucket)
+            )
+    conn.execute(
+        f"UPDATE reflection_rollups SET "
+        f"first_date = (SELECT min({_REFLECTION_DAY_SQL}) FROM items WHERE owner = ?1 AND type = 'reflection'), "
+        f"last_date = (SELECT max({_REFLECTION_DAY_SQL}) FROM items WHERE owner = ?1 AND type = 'reflection') "
+        "WHERE owner = ?1",
+        (owner_key,)
+    )
+    conn.execute("DELETE FROM reflection_rollups WHERE owner = ? AND count <= 0", (owner_key,))
+
+
+def update_metadata(item_id, metadata, owner=None):
+    """Mirror a metadata update made in Chroma"""
+    conn = _connection()
+    with _lock, conn:
+        conn.execute(
+            "UPDATE items SET completed = ?, priority_code = ?, created_at = ?, metadata = ? WHERE owner = ? AND id = ?",
+            (1 if metadata.get("completed") else 0, metadata.get("priority_code"),
+             metadata.get("created_at"), json.dumps(metadata), _owner_key(owner), item_id)
+        )
+
+
+def get_metadata(item_id, owner=None):
+    """Stored metadata of one item, or None if the owner has no such item"""
+    with _lock:
+        row = _connection().execute(
+            "SELECT metadata FROM items WHERE owner = ? AND id = ?", (_owner_key(owner), item_id)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def open_tasks(owner=None):
+    """All incomplete tasks, most pressing priority first, oldest first within a priority"""
+    rank = " ".join(f"WHEN '{code}' THEN {i}" for i, code in enumerate(PRIORITY_ORDER))
+    with _lock:
+        rows = _connection().execute(
+            "SELECT id, document, metadata FROM items WHERE owner = ? AND type = 'task' AND completed = 0 "
+            f"ORDER BY CASE priority_code {rank} ELSE {len(PRIORITY_ORDER)} END, created_at",
+            (_owner_key(owner),)
+        ).fetchall()
+    return _results(rows)
+
+
+# Date fields find_tasks/count_tasks can filter on
+_DATE_COLUMNS = {
+    "created_at": "created_at",
+    "completed_at": "json_extract(metadata, '$.completed_at')",
+}
+
+
+def _task_filter(owner, priority, completed, since, until, date_field):
+    """WHERE clause and parameters for exact task lookups; since/until are YYYY-MM-DD, until exclusive"""
+    clauses = ["owner = ?", "type = 'task'"]
+    params = [_owner_key(owner)]
+    if priority is not None:
+        clauses.append("priority_code = ?")
+        params.append(priority)
+    if completed is not None:
+        clauses.append("completed = ?")
+        params.append(1 if completed else 0)
+    column = _DATE_COLUMNS[date_field]
+    if since is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{column} < ?")
+        params.append(until)
+    return " AND ".join(clauses), params
+
+
+def find_tasks(owner=None, priority=None, completed=None, since=None, until=None, date_field="created_at", limit=None):
+    """Tasks matching exact metadata, most pressing priority first"""
+    where, params = _task_filter(owner, priority, completed, since, until, date_field)
+    rank = " ".join(f"WHEN '{code}' THEN {i}" for i, code in enumerate(PRIORITY_ORDER))
+    sql = (f"SELECT id, document, metadata FROM items WHERE {where} "
+           f"ORDER BY CASE priority_code {rank} ELSE {len(PRIORITY_ORDER)} END, created_at")
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with _lock:
+        rows = _connection().execute(sql, params).fetchall()
+    return _results(rows)
+
+
+def count_tasks(owner=None, priority=None, completed=None, since=None, until=None, date_field="created_at"):
+    where, params = _task_filter(owner, priority, completed, since, until, date_field)
+    with _lock:
+        return _connection().execute(f"SELECT count(*) FROM items WHERE {where}", params).fetchone()[0]
+
+
+def _mean(count, mood_sum, low, high):
+    if not count:
+        return {"count": 0, "mean": None, "min": None, "max": None}
+    return {"count": count, "mean": mood_sum / count, "min": low, "max": high}
+
+
+def mood_stats(owner=None, since=None, until=None):
+    """Count, mean, min and max mood score of the reflections dated in [since, until), from the daily aggregates"""
+    clauses = ["owner = ?", "period = 'day'"]
+    params = [_owner_key(owner)]
+    if since is not None:
+        clauses.append("bucket >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("bucket < ?")
+        params.append(until)
+    with _lock:
+        row = _connection().execute(
+            f"SELECT sum(count), sum(mood_sum), min(min_mood), max(max_mood) FROM mood_aggregates WHERE {' AND '.join(clauses)}",
+            params
+        ).fetchone()
+    return _mean(*row)
+
+
+def mood_aggregate(owner, period, day):
+    """Count, mean, min and max mood of the day/week/month containing day (a date)"""
+    with _lock:
+        row = _connection().execute(
+            "SELECT count, mood_sum, min_mood, max_mood FROM mood_aggregates WHERE owner = ? AND period = ? AND bucket = ?",
+            (_owner_key(owner), period, mood_bucket(period, day))
+        ).fetchone()
+    return _mean(*row) if row else _mean(0, 0, None, None)
+
+
+def mood_trend(owner, period, day):
+    """The period containing day next to the one before it, and the change in mean mood between them"""
+    current = mood_aggregate(owner, period, day)
+    previous = mood_aggregate(owner, period, previous_period_day(period, day))
+    change = current["mean"] - previous["mean"] if current["count"] and previous["count"] else None
+    return {"current": current, "previous": previous, "change": change}
+
+
+def all_items(owner=None):
+    """Every task and reflection the owner has outside the archive, in no particular order"""
+    with _lock:
+        rows = _connection().execute(
+            "SELECT id, document, metadata FROM items WHERE owner = ? AND archived = 0", (_owner_key(owner),)
+        ).fetchall()
+    return _results(rows)
+
+
+def archive_candidates(owner=None, completed_before=None, reflected_before=None, limit=None):
+    """Ids of unarchived tasks completed before completed_before and reflections dated before reflected_before
+
+    Both cutoffs are YYYY-MM-DD (exclusive); None leaves that kind of item in place.
+    """
+    kinds = []
+    params = [_owner_key(owner)]
+    if completed_before is not None:
+        kinds.append("(type = 'task' AND completed = 1 AND "
+                     "substr(coalesce(json_extract(metadata, '$.completed_at'), created_at), 1, 10) < ?)")
+        params.append(completed_before)
+    if reflected_before is not None:
+        kinds.append("(type = 'reflection' AND coalesce(json_extract(metadata, '$.date'), substr(created_at, 1, 10)) < ?)")
+        params.append(reflected_before)
+    if not kinds:
+        return []
+    sql = f"SELECT id FROM items WHERE owner = ? AND archived = 0 AND ({' OR '.join(kinds)}) ORDER BY created_at"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    with _lock:
+        return [row[0] for row in _connection().execute(sql, params).fetchall()]
+
+
+def mark_archived(ids, owner=None):
+    """Record that items moved to the owner's archive collection (they stay in exact lookups and aggregates)"""
+    conn = _connection()
+    owner_key = _owner_key(owner)
+    with _lock, conn:
+        conn.executemany("UPDATE items SET archived = 1 WHERE owner = ? AND id = ?", [(owner_key, item_id) for item_id in ids])
+
+
+def reflection_rollup(owner=None):
+    """Rolling summary of all of the owner's reflections, or None if there are none"""
+    with _lock:
+        row = _connection().execute(
+            "SELECT count, mood_sum, mood_count, first_date, last_date FROM reflection_rollups WHERE owner = ?",
+            (_owner_key(owner),)
+        ).fetchone()
+    if row is None:
+        return None
+    count, mood_sum, mood_count, first_date, last_date = row
+    return {
+        "count": count,
+        "mean_mood": mood_sum / mood_count if mood_count else None,
+        "first_date": first_date,
+        "last_date": last_date,
+    }
+
+
+def rebuild_from_chroma(tenants, page_size=1000, archives=()):
+    """Replace the index with the contents of (owner, collection) pairs; returns the number of items
+
+    archives are (owner, archive collection) pairs whose items are indexed as archived.
+    """
+    conn = _connection()
+    total = 0
+    with _lock, conn:
+        conn.execute("DELETE FROM items")
+        conn.execute("DELETE FROM reflection_rollups")
+        conn.execute("DELETE FROM mood_aggregates")
+        # Archives go first so an item a crashed compaction left in both places counts as not yet archived
+        for archived, pairs in ((True, archives), (False, tenants)):
+            for owner, collection in pairs:
+                offset = 0
+                while True:
+                    page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                    if not page["ids"]:
+                        break
+                    conn.executemany(
+                        _UPSERT,
+                        [_row(owner, item_id, doc or "", meta or {}, archived)
+                         for item_id, doc, meta in zip(page["ids"], page["documents"], page["metadatas"])]
+                    )
+                    total += len(page["ids"])
+                    offset += page_size
+        conn.execute(
+            "INSERT INTO reflection_rollups (owner, count, mood_sum, mood_count, first_date, last_date) "
+            "SELECT owner, count(*), coalesce(sum(json_extract(metadata, '$.mood_score')), 0), "
+            "count(json_extract(metadata, '$.mood_score')), "
+            "min(coalesce(json_extract(metadata, '$.date'), substr(created_at, 1, 10))), "
+            "max(coalesce(json_extract(metadata, '$.date'), substr(created_at, 1, 10))) "
+            "FROM items WHERE type = 'reflection' GROUP BY owner"
+        )
+        reflections = conn.execute("SELECT owner, metadata FROM items WHERE type = 'reflection'").fetchall()
+        conn.executemany(_MOOD_ADD, [row for owner_key, meta in reflections for row in _mood_rows(owner_key, json.loads(meta))])
+    return total
@@ -1,8 +1,18 @@
-from db_setup import get_chroma_collection
+from db_setup import get_tenant_collection, get_archive_collection
 from embeddings import embed_texts
+import task_index
+import lexical_index
+import write_log
+import plan_cache
+import metrics
+import os
 import time
 import uuid
 import re
+from dataclasses import dataclass, field
+
+# "hybrid" fuses BM25 and vector results (with a lexical-only fast path); "dense" is vector search only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
 
 # Priority codes
 PRIORITIES = {
@@ -15,10 +25,8 @@ PRIORITIES = {
     "greyhound": "semi-complete needs follow up"
 }
 
-def add_task(task_text: str, priority_code: str = None):
-    """Add a task to the vector database with priority metadata"""
-    collection = get_chroma_collection()
-    
+def task_metadata(task_text: str, priority_code: str = None) -> dict:
+    """Build the metadata stored with a new task"""
     # Extract priority if mentioned in text
     if not priority_code:
         for code in PRIORITIES:
@@ -37,73 +45,210 @@ def add_task(task_text: str, priority_code: str = None):
         metadata["priority_code"] = priority_code.lower()
         metadata["priority_description"] = PRIORITIES[priority_code.lower()]
     
+    return metadata
+
+def _store(item_id, text, metadata, owner):
+    """Embed and add one new document, or just log it for the background flusher in write-behind mode"""
+    if write_log.WRITE_BEHIND:
+        write_log.log.append("upsert", owner, item_id, metadata, document=text)
+        return
+    collection = get_tenant_collection(owner)
+    embedding = embed_texts([text])[0]
+    with metrics.span("chroma_add"):
+        collection.add(
+            documents=[text],
+            embeddings=[embedding],
+            metadatas=[metadata],
+            ids=[item_id]
+        )
+
+def add_task(task_text: str, priority_code: str = None, owner=None):
+    """Add a task to the owner's collection with priority metadata"""
+    metadata = task_metadata(task_text, priority_code)
+    
     # Generate unique ID
     task_id = f"task_{uuid.uuid4().hex[:8]}"
     
     # Embed and store
-    embedding = embed_texts([task_text])[0]
-    collection.add(
-        documents=[task_text],
-        embeddings=[embedding],
-        metadatas=[metadata],
-        ids=[task_id]
-    )
+    _store(task_id, task_text, metadata, owner)
+    task_index.upsert_items([task_id], [task_text], [metadata], owner=owner)
+    lexical_index.add_items([task_id], [task_text], [metadata], owner=owner)
+    plan_cache.invalidate(owner)
     
     return task_id, metadata
 
-def complete_task(task_id: str):
-    """Mark a task as completed"""
-    collection = get_chroma_collection()
-    
-    # Get current metadata
-    result = collection.get(ids=[task_id])
-    if not result or not result["ids"]:
-        return False, "Task not found"
+def complete_task(task_id: str, owner=None):
+    """Mark one of the owner's tasks as completed"""
+    if write_log.WRITE_BEHIND:
+        # The index already holds pending writes, so there is no need to ask Chroma
+        metadata = task_index.get_metadata(task_id, owner)
+        if metadata is None:
+            return False, "Task not found"
+    else:
+        collection = get_tenant_collection(owner)
+        
+        # Get current metadata
+        with metrics.span("chroma_get"):
+            result = collection.get(ids=[task_id])
+        if not result or not result["ids"]:
+            return False, "Task not found"
+        metadata = result["metadatas"][0]
     
     # Update metadata
-    metadata = result["metadatas"][0]
     metadata["completed"] = True
     metadata["completed_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     
-    # We need to re-add the document to update metadata
-    collection.update(
-        ids=[task_id],
-        metadatas=[metadata]
-    )
+    if write_log.WRITE_BEHIND:
+        write_log.log.append("update", owner, task_id, metadata)
+    else:
+        # We need to re-add the document to update metadata
+        with metrics.span("chroma_update"):
+            collection.update(
+                ids=[task_id],
+                metadatas=[metadata]
+            )
+    task_index.update_metadata(task_id, metadata, owner=owner)
+    lexical_index.update_metadata(task_id, metadata, owner=owner)
+    plan_cache.invalidate(owner)
     
     return True, "Task marked as completed"
 
-def query_tasks(query: str, top_k=5, filter_metadata=None):
-    """Search for tasks by semantic similarity and/or metadata filters"""
-    collection = get_chroma_collection()
-    query_embedding = embed_texts([query])[0]
-    
+@dataclass
+class RetrievedItem:
+    """A single document returned by a similarity search"""
+    id: str
+    document: str
+    metadata: dict
+    distance: float  # None for matches found only by keyword search
+
+@dataclass
+class RetrievalResult:
+    """Tasks and reflections retrieved for one query, plus the embedding used to find them"""
+    query_embedding: list
+    tasks: list = field(default_factory=list)
+    reflections: list = field(default_factory=list)
+
+def build_where(filters: dict):
+    """Turn a flat {field: value} dict into a Chroma where clause"""
+    clauses = [{key: value} for key, value in filters.items()]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+def _priority_filter(query: str) -> dict:
+    for code in PRIORITIES:
+        if code.lower() in query.lower():
+            return {"priority_code": code.lower()}
+    return {}
+
+def _search(collection, query_embedding, n_results, filters) -> list:
+    if n_results <= 0:
+        return []
+    with metrics.span("chroma_query"):
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            where=build_where(filters)
+        )
+    return [
+        RetrievedItem(id=item_id, document=doc, metadata=meta, distance=distance)
+        for item_id, doc, meta, distance in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+        )
+    ]
+
+def _lexical_search(query, n_results, filters, owner) -> list:
+    if n_results <= 0:
+        return []
+    with metrics.span("lexical_search"):
+        hits = lexical_index.search(query, n_results, filters, owner=owner)
+    return [RetrievedItem(id=item_id, document=doc, metadata=meta, distance=None) for item_id, doc, meta in hits]
+
+def _hybrid_search(collection, query, query_embedding, n_results, filters, owner) -> list:
+    """Fuse the vector and BM25 rankings; items only the lexical side found have no distance"""
+    dense = _search(collection, query_embedding, n_results * 2, filters)
+    if RETRIEVAL_MODE == "dense":
+        return dense[:n_results]
+    lexical = _lexical_search(query, n_results * 2, filters, owner)
+    items = {item.id: item for item in lexical}
+    items.update((item.id, item) for item in dense)
+    ranking = lexical_index.fuse([item.id for item in dense], [item.id for item in lexical])
+    return [items[item_id] for item_id in ranking[:n_results]]
+
+def _keyword_fast_path(query: str) -> bool:
+    return RETRIEVAL_MODE != "dense" and lexical_index.is_keyword_query(query)
+
+def query_tasks(query: str, top_k=5, filter_metadata=None, owner=None):
+    """Search the owner's tasks by keywords, semantic similarity and/or metadata filters
+
+    Returns a Chroma query()-shaped dict; distances are None for purely lexical matches.
+    """
     # Handle priority code filtering in query
     if not filter_metadata:
-        filter_metadata = {}
-        for code in PRIORITIES:
-            if code.lower() in query.lower():
-                filter_metadata["priority_code"] = code.lower()
-                break
+        filter_metadata = _priority_filter(query)
+    filters = {"type": "task", **filter_metadata}
     
-    # Construct the query
-    #where = {}
-    if filter_metadata:
-        where = filter_metadata
-    
-    # Execute query
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        #where=where
-    )
+    # Ids, priority words and single keywords skip the embedding when the lexical index has matches
+    items = _lexical_search(query, top_k, filters, owner) if _keyword_fast_path(query) else []
+    if not items:
+        collection = get_tenant_collection(owner)
+        query_embedding = embed_texts([query])[0]
+        items = _hybrid_search(collection, query, query_embedding, top_k, filters, owner)
     
-    return results
+    return {
+        "ids": [[item.id for item in items]],
+        "documents": [[item.document for item in items]],
+        "metadatas": [[item.metadata for item in items]],
+        "distances": [[item.distance for item in items]],
+    }
+
+def search_archive(query: str, top_k=5, filter_metadata=None, owner=None):
+    """Semantic search over the owner's archived tasks and reflections (see archive.py)
+
+    Returns a Chroma query()-shaped dict like query_tasks.
+    """
+    collection = get_archive_collection(owner)
+    items = []
+    if collection.count():
+        query_embedding = embed_texts([query])[0]
+        items = _search(collection, query_embedding, min(top_k, collection.count()), filter_metadata or {})
+    return {
+        "ids": [[item.id for item in items]],
+        "documents": [[item.document for item in items]],
+        "metadatas": [[item.metadata for item in items]],
+        "distances": [[item.distance for item in items]],
+    }
 
-def add_reflection(reflection_text: str, mood_score: int = None):
-    """Add a reflection/mood entry to the vector database"""
-    collection = get_chroma_collection()
+def retrieve_context(query: str, task_k: int = 3, reflection_k: int = 2, task_filter: dict = None, owner=None) -> RetrievalResult:
+    """Embed the query once and fetch the owner's most relevant tasks and reflections
+
+    Keyword-shaped queries answered by the lexical index alone come back with query_embedding None.
+    """
+    if task_filter is None:
+        task_filter = _priority_filter(query)
+    task_filters = {"type": "task", **task_filter}
+    
+    if _keyword_fast_path(query):
+        tasks = _lexical_search(query, task_k, task_filters, owner)
+        if tasks:
+            return RetrievalResult(
+                query_embedding=None,
+                tasks=tasks,
+                reflections=_lexical_search(query, reflection_k, {"type": "reflection"}, owner)
+            )
     
+    collection = get_tenant_collection(owner)
+    query_embedding = embed_texts([query])[0]
+    return RetrievalResult(
+        query_embedding=query_embedding,
+        tasks=_hybrid_search(collection, query, query_embedding, task_k, task_filters, owner),
+        reflections=_hybrid_search(collection, query, query_embedding, reflection_k, {"type": "reflection"}, owner)
+    )
+
+def reflection_metadata(reflection_text: str, mood_score: int = None) -> dict:
+    """Build the metadata stored with a new reflection"""
     # Try to extract mood score from text if not provided
     if mood_score is None:
         # Simple heuristic - check for numerical values
@@ -121,16 +266,19 @@ def add_reflection(reflection_text: str, mood_score: int = None):
     if mood_score is not None:
         metadata["mood_score"] = mood_score
     
+    return metadata
+
+def add_reflection(reflection_text: str, mood_score: int = None, owner=None):
+    """Add a reflection/mood entry to the owner's collection"""
+    metadata = reflection_metadata(reflection_text, mood_score)
+    
     # Generate unique ID
     reflection_id = f"reflection_{uuid.uuid4().hex[:8]}"
     
     # Embed and store
-    embedding = embed_texts([reflection_text])[0]
-    collection.add(
-        documents=[reflection_text],
-        embeddings=[embedding],
-        metadatas=[metadata],
-        ids=[reflection_id]
-    )
+    _store(reflection_id, reflection_text, metadata, owner)
+    task_index.upsert_items([reflection_id], [reflection_text], [metadata], owner=owner)
+    lexical_index.add_items([reflection_id], [reflection_text], [metadata], owner=owner)
+    plan_cache.invalidate(owner)
     
     return reflection_id, metadata
\ No newline at end of file
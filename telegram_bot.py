@@ -1,12 +1,32 @@
 import re
-from db_setup import get_chroma_collection
+from db_setup import tenant_collections, archive_collections, close_chroma
+from telegram.error import TelegramError
 from telegram.ext import Updater, CommandHandler, MessageHandler, filters
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes
+import asyncio
 import os
 import time
 import logging
-from task_manager import add_task, complete_task, query_tasks, add_reflection, PRIORITIES
-from gemma_integration import generate_text
+import tempfile
+import httpx
+from datetime import date
+from task_manager import add_task, complete_task, retrieve_context, add_reflection, search_archive, PRIORITIES
+from gemma_integration import stream_text, close_async_client, ERROR_MESSAGE, OllamaError
+import gemma_integration
+import task_index
+import lexical_index
+import plan_cache
+import answer_cache
+import bulk_io
+import metrics
+import embeddings
+import context_packer
+import intents
+import write_log
+import archive
+import webhook
+from scheduler import scheduler
+from task_index import PRIORITY_ORDER
 
 # Set up logging
 logging.basicConfig(
@@ -15,11 +35,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+# Minimum seconds between progressive edits of a streamed reply
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+# Comma-separated chat ids allowed to use admin commands such as /stats
+ADMIN_CHAT_IDS = {int(chat_id) for chat_id in os.getenv("ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()}
+# Bot API base URL, e.g. a local Bot API server or a stand-in for offline runs (default: api.telegram.org)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL")
+
+# Instructions shared by every generation. Sent as the system prompt, which the model's template puts
+# first, so Ollama evaluates it once and reuses it from its cache while the model stays loaded.
+SYSTEM_PROMPT = (
+    "You are Halsey, a personal assistant that helps the user manage their tasks and plan their day.\n\n"
+    "Here are the priority codes they use:\n"
+    + "".join(f"- {code.capitalize()}: {description}\n" for code, description in PRIORITIES.items())
+    + "\nWhen asked for a day plan, create a balanced day plan that:\n"
+    "1. Prioritizes Ferrari and Tesla tasks\n"
+    "2. Includes breaks and self-care\n"
+    "3. Is realistic and achievable\n"
+    "4. Groups similar tasks together when possible\n"
+    "Please format the plan with time blocks.\n\n"
+    "When asked a question, use the relevant information from their database to give a helpful, "
+    "concise response that addresses it."
+)
+
+async def reply_streaming(message, prompt, header=""):
+    """Stream a Gemma generation into an already-sent message, editing it as tokens arrive
+
+    Returns the generated text, or None if generation failed.
+    """
+    text = ""
+    shown = None
+    last_edit = 0.0
+
+    async def show(body):
+        nonlocal shown, last_edit
+        body = (header + body)[:MAX_MESSAGE_LENGTH]
+        if not body.strip() or body == shown:
+            return
+        try:
+            await message.edit_text(body)
+            shown = body
+        except TelegramError as e:
+            logger.debug(f"Skipping streamed edit: {e}")
+        last_edit = time.monotonic()
+
+    async def queued(position):
+        try:
+            await message.edit_text(f"Queued, position {position}. I'll start as soon as the model is free.")
+        except TelegramError as e:
+            logger.debug(f"Skipping queue notice: {e}")
+    
+    try:
+        # Generations share a bounded number of model slots; the chat's next update may run meanwhile
+        async with scheduler.generation(queued):
+            async for fragment in stream_text(prompt, system=SYSTEM_PROMPT):
+                text += fragment
+                if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                    await show(text)
+    except (httpx.HTTPError, OllamaError) as e:
+        logger.warning(f"Error generating text: {e}")
+        # Keep whatever was streamed, but make clear the answer was cut short
+        await show(f"{text}\n\n{ERROR_MESSAGE}" if text.strip() else ERROR_MESSAGE)
+        return None
+
+    await show(text or "No response generated")
+    return text
+
 async def start(update, context):
     await update.message.reply_text(
         "Hello! I'm Halsey, your GemmaRAG assistant powered by Gemma 3. "
         "I can help you manage tasks and plan your day. "
-        "Use /help to see available commands."
+        "Use /help to see available commands.\n"
+        f"Your chat id is {update.effective_chat.id}."
     )
 
 async def help_command(update, context):
@@ -29,12 +118,16 @@ async def help_command(update, context):
         "/add_task [text] - Add a new task (include priority code in text)\n"
         "/complete_task [task_id] - Mark a task as completed\n"
         "/add_reflection [text] - Add a reflection with optional mood score (e.g., 'Today was good 8/10')\n"
-        "/plan_day - Generate a day plan based on current tasks\n"
+        "/plan_day - Generate a day plan based on current tasks (/plan_day refresh to regenerate)\n"
+        "/search_archive [text] - Search completed tasks and reflections that were archived\n"
+        "/import - Bulk import tasks and reflections from a JSONL or CSV file\n"
         "/help - Show this help message\n\n"
         
         "You can also ask me natural language questions like:\n"
         "- 'Show me my Ferrari tasks'\n"
         "- 'What tasks do I need to complete today?'\n"
+        "- 'How many Tesla tasks are open?'\n"
+        "- 'What did I complete yesterday?'\n"
         "- 'How am I feeling this week?'\n\n"
         
         "*Priority Codes:*\n"
@@ -61,7 +154,7 @@ async def add_task_command(update, context):
             priority = code
             break
     
-    task_id, metadata = add_task(text, priority)
+    task_id, metadata = await asyncio.to_thread(add_task, text, priority, owner=update.effective_chat.id)
     priority_info = f"Priority: {metadata.get('priority_description', 'Not specified')}" if metadata.get('priority_code') else ""
     
     await update.message.reply_text(f"Task stored! ID: {task_id}\n{priority_info}")
@@ -72,7 +165,7 @@ async def complete_task_command(update, context):
         return
     
     task_id = context.args[0]
-    success, message = complete_task(task_id)
+    success, message = await asyncio.to_thread(complete_task, task_id, owner=update.effective_chat.id)
     await update.message.reply_text(message)
 
 async def add_reflection_command(update, context):
@@ -91,172 +184,217 @@ async def add_reflection_command(update, context):
         elif mood_score > 10:
             mood_score = 10
     
-    reflection_id, metadata = add_reflection(text, mood_score)
+    reflection_id, metadata = await asyncio.to_thread(add_reflection, text, mood_score, owner=update.effective_chat.id)
     mood_info = f"Mood score: {metadata['mood_score']}/10" if 'mood_score' in metadata else ""
     
     await update.message.reply_text(f"Reflection stored! ID: {reflection_id}\n{mood_info}")
 
-async def plan_day_command(update, context):
-    # Get today's date
-    today = time.strftime("%Y-%m-%d")
+async def import_command(update, context):
+    """Import tasks/reflections from a JSONL or CSV file sent with the caption /import"""
+    document = update.message.document
+    if document is None:
+        await update.message.reply_text(
+            "Send me a .jsonl or .csv file with the caption /import.\n"
+            "Each row needs a 'text' and optionally 'type' (task/reflection), 'priority_code' and 'mood_score'."
+        )
+        return
     
-    await update.message.reply_text("Generating your day plan... This might take a moment.")
+    suffix = ".csv" if (document.file_name or "").lower().endswith(".csv") else ".jsonl"
+    status_message = await update.message.reply_text("Importing... This might take a moment.")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"import{suffix}")
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(path)
+        try:
+            stats = await asyncio.to_thread(bulk_io.import_file, path, owner=update.effective_chat.id)
+        except Exception as e:
+            # e.g. a file that is not UTF-8; chunks stored before the failure are kept
+            logger.warning(f"Import failed: {e}")
+            await status_message.edit_text(f"Import failed: {e}")
+            return
     
-    # Query all incomplete tasks
-    collection = get_chroma_collection()
-    results = collection.get(
-        where={"completed": False}
+    await status_message.edit_text(
+        f"Imported {stats['imported']} items ({stats['skipped']} skipped) "
+        f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:.0f} rows/sec)."
     )
 
-    # Then filter tasks of type "task"
-    filtered_results = {
-    "documents": [],
-    "metadatas": [],
-    "ids": []
-    }
-
-    for doc, meta, task_id in zip(results["documents"], results["metadatas"], results["ids"]):
-     if meta.get("type") == "task":
-        filtered_results["documents"].append(doc)
-        filtered_results["metadatas"].append(meta)
-        filtered_results["ids"].append(task_id)
-
+async def search_archive_command(update, context):
+    """Search the chat's archived (older, finished) tasks and reflections"""
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text("Please provide what to look for after /search_archive.")
+        return
     
-    # Get recent reflections
-    reflection_results = collection.get(
-        where={"type": "reflection"},
-        limit=3
-    )
+    results = await asyncio.to_thread(search_archive, query, owner=update.effective_chat.id)
+    if not results["ids"][0]:
+        await update.message.reply_text("Nothing matching in your archive.")
+        return
     
-    # Prepare tasks for Gemma
+    response = "From your archive:\n\n"
+    for i, (doc, meta, item_id) in enumerate(zip(results["documents"][0], results["metadatas"][0], results["ids"][0])):
+        when = meta.get("completed_at") or meta.get("date") or meta.get("created_at", "")
+        response += f"{i+1}. {doc}\n{meta.get('type', 'item').capitalize()} {item_id}, {when[:10]}\n\n"
+    await update.message.reply_text(response[:MAX_MESSAGE_LENGTH])
+
+def build_plan_prompt(today, tasks, reflection_summary=""):
+    """Build the /plan_day prompt (after SYSTEM_PROMPT) from open tasks (a Chroma get()-shaped dict) and the reflection summary
+
+    Only the highest-ranked tasks that fit in PLAN_TOKEN_BUDGET are listed; the rest are counted per priority.
+    """
+    # Keep the best-ranked tasks that fit in the budget
+    lines = [
+        (context_packer.score(meta), f"- {doc} (ID: {task_id})\n", (task_id, doc, meta))
+        for doc, meta, task_id in zip(tasks["documents"], tasks["metadatas"], tasks["ids"])
+    ]
+    kept, dropped = context_packer.pack(lines, context_packer.PLAN_TOKEN_BUDGET)
+    
+    # Group tasks by priority
     tasks_by_priority = {}
-    for doc, meta, task_id in zip(results["documents"], results["metadatas"], results["ids"]):
+    for task_id, doc, meta in kept:
         priority = meta.get("priority_code", "unknown")
         if priority not in tasks_by_priority:
             tasks_by_priority[priority] = []
         tasks_by_priority[priority].append({"id": task_id, "text": doc})
     
-    # Build prompt for Gemma
     prompt = f"Today is {today}. Please create a balanced day plan for me based on these tasks:\n\n"
     
     # Add tasks by priority
-    for priority in ["ferrari", "tesla", "amazon", "suzuki", "orange", "greyhound", "budweiser"]:
+    for priority in PRIORITY_ORDER:
         if priority in tasks_by_priority:
             prompt += f"{priority.upper()} TASKS ({PRIORITIES[priority]}):\n"
             for task in tasks_by_priority[priority]:
                 prompt += f"- {task['text']} (ID: {task['id']})\n"
             prompt += "\n"
+    if dropped:
+        prompt += f"Also open but not listed: {context_packer.collapse(meta for _, _, meta in dropped)}\n\n"
     
-    # Add recent reflections for context
-    if reflection_results["documents"]:
-        prompt += "Recent reflections:\n"
-        for doc, meta in zip(reflection_results["documents"], reflection_results["metadatas"]):
-            date = meta.get("created_at", "unknown date")
-            mood = f"Mood: {meta.get('mood_score', '?')}/10" if "mood_score" in meta else ""
-            prompt += f"- [{date}] {doc} {mood}\n"
-    
-    prompt += "\nBased on this information, create a balanced day plan that:\n"
-    prompt += "1. Prioritizes Ferrari and Tesla tasks\n"
-    prompt += "2. Includes breaks and self-care\n"
-    prompt += "3. Is realistic and achievable\n"
-    prompt += "4. Groups similar tasks together when possible\n"
-    prompt += "Please format the plan with time blocks."
-    
-    # Generate plan with Gemma 3
-    plan = generate_text(prompt)
-    await update.message.reply_text(f"Here's your plan for today:\n\n{plan}")
-
-async def handle_message(update, context):
-    user_input = update.message.text
+    # Reflections are represented by their aggregates rather than raw text
+    if reflection_summary:
+        prompt += f"{reflection_summary}\n"
     
-    # Check if this is a task creation request
-    if any(keyword in user_input.lower() for keyword in ["add task", "new task", "create task"]):
-        for code in PRIORITIES:
-            if code.lower() in user_input.lower():
-                task_id, metadata = add_task(user_input)
-                await update.message.reply_text(f"Task added! ID: {task_id}\nPriority: {metadata.get('priority_description', 'Not specified')}")
-                return
-    
-    # Check if this is a task query
-    if any(keyword in user_input.lower() for keyword in ["find task", "show task", "list task", "my task"]):
-        # Determine if user wants specific priorities
-        filter_metadata = {}
-        for code in PRIORITIES:
-            if code.lower() in user_input.lower():
-                filter_metadata["priority_code"] = code.lower()
-                break
-        
-        # Handle completion status filtering
-        if "completed" in user_input.lower():
-            filter_metadata["completed"] = True
-        elif "incomplete" in user_input.lower() or "not done" in user_input.lower():
-            filter_metadata["completed"] = False
-        
-        results = query_tasks(user_input, filter_metadata=filter_metadata)
-        
-        if not results["documents"] or len(results["documents"][0]) == 0:
-            await update.message.reply_text("No matching tasks found.")
-            return
-        
-        # Format the results
-        response = "Here are your tasks:\n\n"
-        for i, (doc, meta, id) in enumerate(zip(results["documents"][0], results["metadatas"][0], results["ids"][0])):
-            status = "✓ DONE" if meta.get("completed", False) else "◯ PENDING"
-            priority = f"[{meta.get('priority_code', 'Unknown').upper()}]" if meta.get("priority_code") else ""
-            response += f"{i+1}. {status} {priority} {doc}\nID: {id}\n\n"
-        
-        await update.message.reply_text(response)
+    # The plan rules are in SYSTEM_PROMPT
+    prompt += "\nBased on this information, create my day plan."
+    return prompt
+
+async def plan_day_command(update, context):
+    # Get today's date
+    today = time.strftime("%Y-%m-%d")
+    owner = update.effective_chat.id
+    force = bool(context.args) and context.args[0].lower() in ("refresh", "force", "new")
+    
+    # Incomplete tasks and the mood aggregates come straight from the metadata index
+    tasks = await asyncio.to_thread(task_index.open_tasks, owner)
+    summary = await asyncio.to_thread(context_packer.reflection_summary, owner, date.fromisoformat(today))
+    
+    # Reuse today's plan if nothing it was built from has changed
+    state = plan_cache.fingerprint(tasks, summary)
+    plan = None if force else plan_cache.get(owner, today, state)
+    if plan is not None:
+        await update.message.reply_text(f"Here's your plan for today:\n\n{plan}")
         return
     
-    # For other queries, use Gemma with retrieved context
-    await update.message.reply_text("Thinking...")
-    
-    # Get relevant tasks for context
-    task_results = query_tasks(user_input, top_k=3)
-    
-    # Get relevant reflections for context
-    from db_setup import get_chroma_collection
-    reflection_results = get_chroma_collection().query(
-        query_embeddings=[embed_texts([user_input])[0]],
-        n_results=2,
-        where={"type": "reflection"}
-    )
+    status_message = await update.message.reply_text("Generating your day plan... This might take a moment.")
+    with metrics.span("prompt_build_plan"):
+        prompt = build_plan_prompt(today, tasks, summary)
     
+    # Generate plan with Gemma 3, streaming it into the status message
+    plan = await reply_streaming(status_message, prompt, header="Here's your plan for today:\n\n")
+    if plan:
+        plan_cache.put(owner, today, state, plan)
+
+def build_answer_prompt(user_input, retrieved):
+    """Build the free-form question prompt (after SYSTEM_PROMPT) from the retrieved tasks and reflections, within RAG_TOKEN_BUDGET"""
     # Build context from retrieved documents
-    context_docs = []
-    if task_results["documents"] and task_results["documents"][0]:
-        for doc, meta in zip(task_results["documents"][0], task_results["metadatas"][0]):
-            status = "completed" if meta.get("completed", False) else "pending"
-            priority = f"{meta.get('priority_code', 'unknown')} ({meta.get('priority_description', '')})" if meta.get("priority_code") else "no priority"
-            context_docs.append(f"Task: {doc} | Status: {status} | Priority: {priority}")
+    lines = []
+    for item in retrieved.tasks:
+        meta = item.metadata
+        status = "completed" if meta.get("completed", False) else "pending"
+        priority = f"{meta.get('priority_code', 'unknown')} ({meta.get('priority_description', '')})" if meta.get("priority_code") else "no priority"
+        line = f"Task: {item.document} | Status: {status} | Priority: {priority}"
+        lines.append((context_packer.score(meta, item.distance), line, line))
     
     # Add relevant reflections to context
-    if reflection_results["documents"] and reflection_results["documents"][0]:
-        for doc, meta in zip(reflection_results["documents"][0], reflection_results["metadatas"][0]):
-            date = meta.get("created_at", "unknown date")
-            mood = f"Mood: {meta.get('mood_score', '?')}/10" if "mood_score" in meta else ""
-            context_docs.append(f"Reflection [{date}]: {doc} {mood}")
-    
+    for item in retrieved.reflections:
+        meta = item.metadata
+        date = meta.get("created_at", "unknown date")
+        mood = f"Mood: {meta.get('mood_score', '?')}/10" if "mood_score" in meta else ""
+        line = f"Reflection [{date}]: {item.document} {mood}"
+        lines.append((context_packer.score(meta, item.distance), line, line))
+    
+    context_docs, _ = context_packer.pack(lines, context_packer.RAG_TOKEN_BUDGET)
     context_block = "\n".join(context_docs) if context_docs else "No relevant information found."
     
-    # Create prompt for Gemma 3
+    # Create prompt for Gemma 3 (the priority code legend is in SYSTEM_PROMPT)
     prompt = (
-        f"The user is asking: '{user_input}'\n\n"
         f"Relevant information from their database:\n{context_block}\n\n"
-        "Here are the priority codes they use:\n"
-        "- Ferrari: urgent and important\n"
-        "- Tesla: semi-urgent and important\n"
-        "- Amazon: not urgent but important\n"
-        "- Suzuki: urgent, not important but necessary\n"
-        "- Orange: semi-urgent, not important but eventually necessary\n"
-        "- Budweiser: not important not urgent\n"
-        "- Greyhound: semi-complete needs follow up\n\n"
+        f"The user is asking: '{user_input}'\n\n"
         "Based on the above information, please provide a helpful, concise response that addresses the user's query:"
     )
+    return prompt
+
+async def handle_message(update, context):
+    user_input = update.message.text
+    
+    # Adding, completing, listing and counting tasks and mood questions are answered from metadata
+    intent = intents.route(user_input)
+    intents.record(intent)
+    if intent is not None:
+        response = await asyncio.to_thread(intents.answer, intent, update.effective_chat.id)
+        await update.message.reply_text(response[:MAX_MESSAGE_LENGTH])
+        return
+    
+    # For other queries, use Gemma with retrieved context
+    status_message = await update.message.reply_text("Thinking...")
+    
+    # Get relevant tasks and reflections for context (one embedding for both)
+    retrieved = await asyncio.to_thread(retrieve_context, user_input, task_k=3, reflection_k=2, owner=update.effective_chat.id)
+    
+    # Reuse the answer to a near-identical question grounded on the same, unchanged documents
+    # (keyword lookups answered without an embedding are not cached)
+    scope = update.effective_chat.id
+    signature = answer_cache.context_signature(retrieved)
+    cacheable = retrieved.query_embedding is not None
+    cached_answer = answer_cache.cache.lookup(scope, retrieved.query_embedding, signature) if cacheable else None
+    if cached_answer is not None:
+        await status_message.edit_text(cached_answer[:MAX_MESSAGE_LENGTH])
+        return
+    
+    with metrics.span("prompt_build_rag"):
+        prompt = build_answer_prompt(user_input, retrieved)
+    
+    # Generate response from Gemma 3, streaming it into the status message
+    answer = await reply_streaming(status_message, prompt)
+    if answer and cacheable:
+        answer_cache.cache.store(scope, retrieved.query_embedding, signature, answer)
+
+async def stats_command(update, context):
+    """Admin-only latency and cache report"""
+    if update.effective_chat.id not in ADMIN_CHAT_IDS:
+        await update.message.reply_text("Sorry, /stats is only available to the bot's admins.")
+        return
     
-    # Generate response from Gemma 3
-    response = generate_text(prompt)
-    await update.message.reply_text(response)
+    embedding_stats = embeddings.cache.stats()
+    answer_stats = answer_cache.cache.stats()
+    plan_total = plan_cache.hits + plan_cache.misses
+    router_stats = intents.stats()
+    queue = scheduler.stats()
+    writes = write_log.log.stats()
+    report = (
+        "Stage latencies:\n"
+        f"{metrics.summary()}\n\n"
+        "Caches:\n"
+        f"embeddings: {embedding_stats['hit_rate']:.0%} hit rate ({embedding_stats['hits']}/{embedding_stats['hits'] + embedding_stats['misses']})\n"
+        f"answers: {answer_stats['hit_rate']:.0%} hit rate ({answer_stats['hits']}/{answer_stats['hits'] + answer_stats['misses']})\n"
+        f"plans: {plan_cache.hits / plan_total if plan_total else 0:.0%} hit rate ({plan_cache.hits}/{plan_total})\n\n"
+        "Intent router:\n"
+        f"{router_stats['hit_rate']:.0%} of messages answered without the LLM ({router_stats['routed']}/{router_stats['total']})"
+        + "".join(f"\n{name}: {count}" for name, count in sorted(router_stats["intents"].items()))
+        + "\n\nLLM queue:\n"
+        f"{queue['running']} generating, {queue['waiting']} waiting, {queue['coalesced']} duplicate requests merged"
+        + (f"\n\nWrite-behind: {writes['pending']} pending, {writes['flushed']} flushed" if write_log.WRITE_BEHIND else "")
+        + f"\n\nArchive: {archive.archived} items moved since start"
+    )
+    await update.message.reply_text(report[:MAX_MESSAGE_LENGTH])
 
 async def error_handler(update, context):
     """Log Errors caused by Updates."""
@@ -264,46 +402,111 @@ async def error_handler(update, context):
     if update:
         await update.message.reply_text("Sorry, something went wrong. Please try again.")
 
-def main():
-    # Get the token from environment variable
-    telegram_token = os.getenv("TELEGRAM_TOKEN")
-    
-    if not telegram_token:
-        print("Error: TELEGRAM_TOKEN environment variable not set.")
-        print("Please set it with: export TELEGRAM_TOKEN='your_token_here'")
-        return
-    
+def rebuild_task_index():
+    start = time.perf_counter()
+    # Writes still waiting in the write-behind log are not in Chroma yet, so put them back afterwards
+    with write_log.log.paused():
+        count = task_index.rebuild_from_chroma(tenant_collections(), archives=archive_collections())
+        write_log.log.replay_into_index()
+    # Keyword indexes built from the old index contents are rebuilt on the next search
+    lexical_index.reset()
+    logger.info(f"Task index rebuilt with {count} items in {time.perf_counter() - start:.2f}s")
+    # Data from before per-chat collections is in no chat until it is claimed
+    legacy = task_index.count_tasks() + (task_index.reflection_rollup() or {}).get("count", 0)
+    if legacy:
+        logger.warning(f"{legacy} tasks and reflections were stored before data was kept per chat and are not "
+                       "shown in any chat; stop the bot and run: python bulk_io.py claim-legacy --owner <chat id>")
+
+async def prepare_index():
+    """Rebuild the task index, then start archiving old history (compaction reads the index)"""
+    await asyncio.to_thread(rebuild_task_index)
+    archive.start()
+
+async def startup(application):
+    """Rebuild the metadata index from the vector store without delaying the first update
+
+    Index reads and writes issued during the rebuild wait on the index lock until it finishes.
+    Writes acknowledged but not flushed before a crash are recovered from the write-behind log.
+    The model is loaded, and kept loaded while idle, in the background.
+    """
+    if write_log.WRITE_BEHIND or os.path.exists(write_log.log.path):
+        write_log.log.start()
+    application.create_task(prepare_index())
+    if gemma_integration.OLLAMA_KEEP_WARM:
+        gemma_integration.start_keep_warm(SYSTEM_PROMPT)
+    if metrics.start_http_server():
+        logger.info(f"Serving metrics on http://127.0.0.1:{metrics.METRICS_PORT}/metrics")
+
+async def shutdown(application):
+    """Flush pending writes, release pooled connections and close the vector store when the bot stops"""
+    await asyncio.to_thread(archive.stop)
+    await asyncio.to_thread(write_log.log.stop)
+    await gemma_integration.stop_keep_warm()
+    await close_async_client()
+    close_chroma()
+
+def build_application(telegram_token, base_url=TELEGRAM_BASE_URL):
+    """Create the Application with every handler registered, ready for polling or webhook delivery"""
     # Create the Updater and pass it your bot's token
     #updater = Updater(token=telegram_token, use_context=True)
-    application = ApplicationBuilder().token(telegram_token).build()
+    # Handle updates concurrently so one long generation doesn't hold up other chats
+    builder = (
+        ApplicationBuilder()
+        .token(telegram_token)
+        .concurrent_updates(True)
+        .post_init(startup)
+        .post_shutdown(shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
     
     # Get the dispatcher to register handlers
     #dp = updater.dispatcher
     
-    # Register command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("add_task", add_task_command))
-    application.add_handler(CommandHandler("complete_task", complete_task_command))
-    application.add_handler(CommandHandler("add_reflection", add_reflection_command))
-    application.add_handler(CommandHandler("plan_day", plan_day_command))
+    # Register command handlers; each chat's updates run in order, and repeated
+    # LLM requests still in flight (e.g. /plan_day tapped three times) are answered once
+    ordered = scheduler.handler
+    application.add_handler(CommandHandler("start", ordered(start)))
+    application.add_handler(CommandHandler("help", ordered(help_command)))
+    application.add_handler(CommandHandler("add_task", ordered(add_task_command)))
+    application.add_handler(CommandHandler("complete_task", ordered(complete_task_command)))
+    application.add_handler(CommandHandler("add_reflection", ordered(add_reflection_command)))
+    application.add_handler(CommandHandler("plan_day", ordered(plan_day_command, coalesce=True)))
+    application.add_handler(CommandHandler("search_archive", ordered(search_archive_command)))
+    application.add_handler(CommandHandler("import", ordered(import_command)))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/import\b"), ordered(import_command)))
     
     # Register message handler
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, ordered(handle_message, coalesce=True)))
     
     # Register error handler
     application.add_error_handler(error_handler)
+    return application
+
+def main():
+    # Get the token from environment variable
+    telegram_token = os.getenv("TELEGRAM_TOKEN")
+    
+    if not telegram_token:
+        print("Error: TELEGRAM_TOKEN environment variable not set.")
+        print("Please set it with: export TELEGRAM_TOKEN='your_token_here'")
+        return
+    
+    application = build_application(telegram_token)
     
     # Start the Bot
-    print("Starting bot...")
-    application.run_polling()
+    if webhook.BOT_MODE == "webhook":
+        print(f"Starting bot (webhook on {webhook.WEBHOOK_LISTEN}:{webhook.WEBHOOK_PORT}{webhook.WEBHOOK_PATH})...")
+        webhook.run(application)
+    else:
+        print("Starting bot...")
+        application.run_polling()
     
     # Run the bot until you press Ctrl-C
     print("Bot is running! Press Ctrl+C to stop.")
     #application.idle()
 
-# Import needed for handle_message function
-from embeddings import embed_texts
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""Webhook delivery of Telegram updates (BOT_MODE=webhook) as an alternative to long polling.
+
+A small asyncio HTTP endpoint accepts the updates Telegram POSTs, checks the secret token and
+puts them on the Application's update queue, where they are handled concurrently exactly as
+polled updates are. Put it behind an HTTPS reverse proxy and set WEBHOOK_URL to the public
+address so the bot registers it on startup. Without WEBHOOK_URL nothing is registered, which
+is how it is run offline: recorded updates can be posted to the endpoint directly.
+
+Usage:
+    python webhook.py post updates.jsonl [--url http://127.0.0.1:8443/telegram] [--secret TOKEN]
+"""
+import argparse
+import asyncio
+import contextlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import time
+from http import HTTPStatus
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Local address the webhook endpoint listens on, and the path updates are POSTed to
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Public HTTPS URL registered with Telegram (unset = don't register, e.g. for offline testing)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+# Expected X-Telegram-Bot-Api-Secret-Token; generated at startup when WEBHOOK_URL is set without one
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Connections Telegram may open to the endpoint at once
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Seconds requests still being received get to finish on shutdown
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class WebhookServer:
+    """HTTP/1.1 endpoint feeding POSTed updates into application.update_queue"""
+
+    def __init__(self, application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+        self._closing = False
+        self._idle = set()       # connections waiting for their next request
+        self._handlers = set()   # one task per open connection
+
+    @property
+    def url(self):
+        return f"http://{self.listen}:{self.port}{self.path}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve_connection, self.listen, self.port)
+        # Port 0 picks a free port
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook endpoint listening on {self.url}")
+
+    async def stop(self):
+        """Stop accepting updates and let requests already being received finish"""
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._idle):
+            writer.close()
+        if self._handlers:
+            _, pending = await asyncio.wait(set(self._handlers), timeout=WEBHOOK_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+
+    async def _serve_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while not self._closing:
+                self._idle.add(writer)
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                finally:
+                    self._idle.discard(writer)
+                status, keep_alive = await self._handle_request(head, reader)
+                if status is None:
+                    return
+                keep_alive = keep_alive and not self._closing
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Length: 0\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1")
+                )
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def _handle_request(self, head, reader):
+        """Answer one request; returns (status, whether the connection can be reused), status None to just close"""
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, False
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, False
+        if length > MAX_BODY_BYTES:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, False
+        try:
+            body = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            # The client went away mid-body; there is nobody to answer
+            return None, False
+        keep_alive = headers.get("connection", "").lower() != "close"
+
+        if target.split("?", 1)[0] != self.path:
+            status = HTTPStatus.NOT_FOUND
+        elif method != "POST":
+            status = HTTPStatus.METHOD_NOT_ALLOWED
+        elif self.secret and not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), self.secret):
+            status = HTTPStatus.FORBIDDEN
+        else:
+            try:
+                payload = json.loads(body)
+                # de_json expects an object; anything else, or an update with wrong-typed fields, is a bad request
+                update = Update.de_json(payload, self.application.bot) if isinstance(payload, dict) else None
+            except (ValueError, TypeError, KeyError, AttributeError):
+                update = None
+            if update is None:
+                status = HTTPStatus.BAD_REQUEST
+            else:
+                # Telegram only needs to know the update arrived; handling happens in the Application
+                await self.application.update_queue.put(update)
+                self.received += 1
+                return HTTPStatus.OK, keep_alive
+        self.rejected += 1
+        return status, keep_alive
+
+
+async def serve(application, url=WEBHOOK_URL, secret=WEBHOOK_SECRET, **server_options):
+    """Run the application on webhook updates until SIGINT/SIGTERM, with the same lifecycle hooks as run_polling"""
+    if url and not secret:
+        secret = secrets.token_urlsafe(32)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # Not available on Windows, where Ctrl+C cancels serve() instead
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    server = WebhookServer(application, secret=secret, **server_options)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await server.start()
+        if url:
+            await application.bot.set_webhook(
+                url, secret_token=secret, allowed_updates=Update.ALL_TYPES, max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"Webhook registered at {url}")
+        await application.start()
+        await stop.wait()
+    finally:
+        # Accepted updates are already queued; Application.stop() waits for their handlers to finish
+        await server.stop()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run(application):
+    """Blocking counterpart of application.run_polling() for BOT_MODE=webhook"""
+    asyncio.run(serve(application))
+
+
+async def post_updates(url, updates, secret=None):
+    """POST recorded updates to a webhook endpoint; returns (status codes, seconds)"""
+    import httpx
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    statuses = []
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        for update in updates:
+            response = await client.post(url, json=update, headers=headers)
+            statuses.append(response.status_code)
+    return statuses, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook helpers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    post_parser = commands.add_parser("post", help="POST recorded updates (one JSON object per line) to a running bot")
+    post_parser.add_argument("path")
+    post_parser.add_argument("--url", default=f"http://{WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    post_parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    statuses, elapsed = asyncio.run(post_updates(args.url, updates, args.secret))
+    accepted = statuses.count(200)
+    print(f"✅ Posted {len(updates)} updates in {elapsed:.2f}s: {accepted} accepted, {len(updates) - accepted} rejected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from db_setup import get_tenant_collection
+from embeddings import embed_texts
+import metrics
+import task_index
+
+logger = logging.getLogger(__name__)
+
+# Set WRITE_BEHIND=1 to acknowledge task/reflection writes before they reach Chroma
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+# Append-only log of acknowledged writes; "<path>.checkpoint" records how far Chroma has caught up
+WRITE_LOG_PATH = os.getenv("WRITE_LOG_PATH", "./write_log.jsonl")
+# Seconds between background flushes, and the most writes embedded/stored per flush
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "256"))
+# fsync every append (set to 0 to trade crash durability for write latency)
+WRITE_LOG_FSYNC = os.getenv("WRITE_LOG_FSYNC", "1") == "1"
+
+
+class WriteLog:
+    """Durable queue of writes acknowledged to the user but not yet stored in Chroma
+
+    Entries are {"seq", "op": "upsert"|"update", "owner", "id", "document", "metadata"}. The
+    caller mirrors each write into task_index straight away, so reads see it before the flush.
+    """
+
+    def __init__(self, path=WRITE_LOG_PATH, flush_interval=WRITE_FLUSH_INTERVAL, batch_size=WRITE_BATCH_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.flushed = 0
+        self._pending = []
+        self._seq = 0
+        self._file = None
+        self._lock = threading.Lock()         # log file and pending list
+        self._flush_lock = threading.Lock()   # one flush at a time
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _checkpoint_path(self):
+        return self.path + ".checkpoint"
+
+    def _read_checkpoint(self):
+        try:
+            with open(self._checkpoint_path()) as f:
+                return json.load(f)["seq"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _write_checkpoint(self, seq):
+        tmp = self._checkpoint_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"seq": seq}, f)
+        os.replace(tmp, self._checkpoint_path())
+
+    def _open(self):
+        """Load writes a previous run acknowledged but never flushed"""
+        if self._file is not None:
+            return
+        done = self._read_checkpoint()
+        self._seq = done
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn final line from a crash mid-append
+                    self._seq = max(self._seq, entry["seq"])
+                    if entry["seq"] > done:
+                        self._pending.append(entry)
+        if self._pending:
+            logger.info(f"Recovered {len(self._pending)} unflushed writes from {self.path}")
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def append(self, op, owner, item_id, metadata, document=None):
+        """Durably record one write; returns once it is safe to acknowledge"""
+        with self._lock:
+            self._open()
+            self._seq += 1
+            entry = {"seq": self._seq, "op": op, "owner": owner, "id": item_id, "document": document, "metadata": metadata}
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if WRITE_LOG_FSYNC:
+                os.fsync(self._file.fileno())
+            self._pending.append(entry)
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def pending(self):
+        """Snapshot of the writes not yet in Chroma, oldest first"""
+        with self._lock:
+            self._open()
+            return list(self._pending)
+
+    def flush(self):
+        """Store up to batch_size pending writes in Chroma; returns how many were stored"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+            if not batch:
+                return 0
+
+            # Collapse the batch to one upsert or metadata update per item, latest state wins
+            by_owner = {}
+            for entry in batch:
+                items = by_owner.setdefault(entry["owner"], {})
+                current = items.get(entry["id"])
+                if entry["op"] == "update" and current is not None:
+                    current["metadata"] = entry["metadata"]
+                else:
+                    items[entry["id"]] = {"op": entry["op"], "document": entry["document"], "metadata": entry["metadata"]}
+
+            with metrics.span("write_behind_flush"):
+                for owner, items in by_owner.items():
+                    collection = get_tenant_collection(owner)
+                    upserts = [(item_id, item) for item_id, item in items.items() if item["op"] == "upsert"]
+                    updates = [(item_id, item) for item_id, item in items.items() if item["op"] == "update"]
+                    if upserts:
+                        documents = [item["document"] for _, item in upserts]
+                        collection.upsert(
+                            ids=[item_id for item_id, _ in upserts],
+                            documents=documents,
+                            embeddings=embed_texts(documents, cache_results=False),
+                            metadatas=[item["metadata"] for _, item in upserts]
+                        )
+                    if updates:
+                        collection.update(
+                            ids=[item_id for item_id, _ in updates],
+                            metadatas=[item["metadata"] for _, item in updates]
+                        )
+
+            with self._lock:
+                del self._pending[:len(batch)]
+                self._write_checkpoint(batch[-1]["seq"])
+                # Everything acknowledged is in Chroma, so the log can start over
+                if not self._pending:
+                    self._file.truncate(0)
+                    self._file.seek(0)
+            self.flushed += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                while self.flush() == self.batch_size:
+                    pass
+            except Exception as e:
+                # Entries stay pending and are retried on the next tick
+                logger.warning(f"Write-behind flush failed: {e}")
+
+    def start(self):
+        """Load unflushed writes from the last run and start the background flusher"""
+        with self._lock:
+            self._open()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher after storing everything still pending
+
+        If Chroma can't take them now, they stay in the log and are stored after the next start.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        try:
+            self.drain()
+        except Exception as e:
+            # Shutdown goes on; the entries are already durable in the log
+            logger.warning(f"Could not flush {self.stats()['pending']} pending writes on shutdown, "
+                           f"keeping them in {self.path} for the next start: {e}")
+
+    def drain(self):
+        """Flush until nothing is pending"""
+        while self.flush():
+            pass
+
+    @contextmanager
+    def paused(self):
+        """Hold off flushing, e.g. while task_index is rebuilt from Chroma"""
+        with self._flush_lock:
+            yield
+
+    def replay_into_index(self):
+        """Re-apply pending writes to task_index, e.g. after it was rebuilt from Chroma (which lacks them)"""
+        if self._file is None:
+            return
+        for entry in self.pending():
+            if entry["op"] == "upsert":
+                task_index.upsert_items([entry["id"]], [entry["document"]], [entry["metadata"]], owner=entry["owner"])
+            else:
+                task_index.update_metadata(entry["id"], entry["metadata"], owner=entry["owner"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": len(self._pending), "flushed": self.flushed, "last_seq": self._seq}
+
+
+log = WriteLog()